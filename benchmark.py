@@ -0,0 +1,481 @@
+"""benchmarks for the hot paths of generation and extraction, run against
+the fixed fixtures in fixtures/ with fixed seeds, so that runs can be compared
+with each other:
+
+    $ python benchmark.py --json before.json
+    ... change something ...
+    $ python benchmark.py --baseline before.json
+
+each benchmark is timed a few times and the fastest run counts. with --json,
+the results are saved; with --baseline, they're compared to saved results,
+and any benchmark that got slower by more than --threshold (10% by default)
+is reported as a regression (and the exit status is 1). benchmarks that need
+spaCy or WordNet are skipped if they aren't installed.
+
+the sentence post-processing benchmarks (normalize, punctuate, depunct,
+tex_escape) are also timed against the reference implementations they
+replaced, which are kept here (and used by test.py to check that the output
+hasn't changed).
+"""
+
+import os
+import random
+import re
+import sys
+import time
+
+# sentences that exercise every step of normalize
+sample_sentences = [
+    u"The river flowed gently past the old stone mill.",
+    u"The growing darkness seemed a protection ( from the wind ).",
+    u"The sea was pretty calm ; a slight breeze blew on land .",
+    u"It is one of the most graceful of the conifers -- i think.",
+    u"The lake 's surface was smooth , and the others ' boats were gone.",
+    u"A little hole showed back of the left ear and another at the right "
+        u"temple.",
+    u"\"The waves were tremendous \" , and the {rocks} were _wet_ .",
+    u"The wind - which was cold - blew from the north)",
+    u"The storm continued four days (and the snow had reached a depth",
+    u"The mesa was beautiful\r\nin the evening light!",
+    u"` the rain in spain falls mainly on the plain ` ?",
+    u"the trees ( tall ( very tall ) ) were near both rivers ) .",
+]
+
+def reference_normalize(s):
+    "extract.normalize as it was, one re.sub after another"
+    from extract import ucfirst
+    s = s.lower().strip()
+    s = re.sub("[\r\n]+", " ", s)
+    s = re.sub(r"others '", "others'", s)
+    s = re.sub(r'(^|\s+)[\'"`_](\s+|$)', ' ', s)
+    s = re.sub(r"\s([.,;:!?])(\s|$)", r"\1 ", s)
+    s = re.sub(r"\s*'s", "'s", s)
+    s = re.sub(r'\bi\b', 'I', s)
+    s = re.sub(r'\(\s*([^)]*)\)', r'(\1)', s)
+    s = re.sub(r'\s*\)', ')', s)
+    s = re.sub(r'--', u"\u2014", s)
+    s = re.sub(r'[{}]', '', s)
+    s = re.sub(r' - ', '-', s)
+    s = re.sub(r'_', '', s)
+    if ')' in s and '(' not in s:
+        s = s.replace(')', '')
+    if '(' in s and ')' not in s:
+        s = s.replace('(', '')
+    return ucfirst(s)
+
+def reference_punctuate(s):
+    if not(re.search(r"[.!?]$", s)):
+        s += "."
+    return s
+
+def reference_depunct(s):
+    if re.search(r"[.!?]$", s):
+        return s[:-1]
+    else:
+        return s
+
+def reference_tex_escape(text):
+    "gen.tex_escape as it was, compiling its regular expression every time"
+    from gen import tex_escapes
+    regex = re.compile('|'.join(re.escape(unicode(key)) \
+        for key in sorted(tex_escapes.keys(), key = lambda item: - len(item))))
+    return regex.sub(lambda match: tex_escapes[match.group()], text)
+
+def read_sentences(fname):
+    "the sentences from a file of tab-separated (source id, sentence) lines"
+    with open(fname) as fh:
+        return [line.decode('utf8').rstrip("\n").split("\t", 1)[-1]
+                for line in fh]
+
+def best_time(run, repeat=3):
+    "fastest of repeat calls to run, in seconds"
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        run()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+fixtures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        'fixtures')
+
+class Skip(Exception):
+    "raised by a benchmark that can't run here"
+
+class Fixtures(object):
+    """what the benchmarks run against, each loaded (untimed) the first time
+    a benchmark asks for it."""
+    def __init__(self, sentence_fname, book_fname):
+        self.sentence_fname = sentence_fname
+        self.book_fname = book_fname
+        self._nlp = None
+        self._sdb = None
+
+    def nlp(self):
+        if self._nlp is None:
+            try:
+                from spacy.en import English
+            except ImportError:
+                raise Skip("spacy isn't installed")
+            sys.stderr.write("initializing spacy...")
+            self._nlp = English(data_dir=os.environ.get('SPACY_DATA'))
+            sys.stderr.write("done.\n")
+        return self._nlp
+
+    def sdb(self):
+        if self._sdb is None:
+            from gen import sentence_db
+            with open(self.sentence_fname) as fh:
+                self._sdb = sentence_db(self.nlp(), fh)
+        return self._sdb
+
+    def sentences(self):
+        return read_sentences(self.sentence_fname)
+
+    def book_lines(self):
+        with open(self.book_fname) as fh:
+            return [line.decode('utf8') for line in fh]
+
+    def wordnet(self):
+        try:
+            import pattern.en
+        except ImportError:
+            raise Skip("pattern isn't installed")
+
+# lemmas for the WordNet predicates: nature words, people words and some
+# that are neither
+benchmark_lemmas = ['river', 'mountain', 'wind', 'lake', 'tree', 'snow',
+        'valley', 'cliff', 'glacier', 'beach', 'rock', 'marsh', 'creek',
+        'guide', 'man', 'companion', 'child', 'people', 'baker', 'person',
+        'house', 'horse', 'fire', 'bread', 'village', 'truth', 'storm',
+        'might', 'asdf', 'morning']
+
+# each benchmark is a function that takes the Fixtures and returns a
+# function to time; anything it does before returning isn't timed.
+
+def bench_sentence_db(fixtures):
+    from gen import sentence_db
+    nlp = fixtures.nlp()
+    def run():
+        with open(fixtures.sentence_fname) as fh:
+            sentence_db(nlp, fh)
+    return run
+
+def bench_sentence_store(fixtures, count=1000):
+    "opening a saved sentence database and picking from it"
+    import atexit, shutil, tempfile
+    from gen import save_sentence_db, load_sentence_db, random_sentence
+    tmp = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, tmp, True)
+    path = os.path.join(tmp, 'benchmark.sdb')
+    save_sentence_db(fixtures.sdb(), path, 'benchmark')
+    def run():
+        store = load_sentence_db(path, 'benchmark')
+        rng = random.Random(0)
+        for i in range(count):
+            random_sentence(store, rng)
+    return run
+
+def bench_random_sentences(fixtures, count=1000):
+    from gen import random_sentence
+    sdb = fixtures.sdb()
+    def run():
+        rng = random.Random(0)
+        for i in range(count):
+            random_sentence(sdb, rng)
+    return run
+
+def bench_paragraph(fixtures, count=200):
+    from gen import NovelState, ChapterState, paragraph, current_model
+    import numpy
+    sdb = fixtures.sdb()
+    def run():
+        rng = random.Random(0)
+        state = NovelState(chapter_count=2, rng=rng)
+        rs = numpy.random.RandomState(0)
+        for sequence in current_model().sample(['start'] * count, rs):
+            paragraph(sdb, ChapterState(state), sequence)
+    return run
+
+def bench_chapter(fixtures, count=50):
+    from gen import NovelState, chapter
+    sdb = fixtures.sdb()
+    def run():
+        state = NovelState(chapter_count=count, rng=random.Random(0))
+        for i in range(count):
+            state.i = i
+            chapter(sdb, state)
+    return run
+
+def bench_novel(chapter_count):
+    def bench(fixtures):
+        from gen import novel
+        sdb = fixtures.sdb()
+        def run():
+            random.seed(0)
+            for ch in novel(sdb, chapter_count):
+                pass
+        return run
+    return bench
+
+def bench_surface(fixtures, count=100):
+    from gen import novel, surface
+    random.seed(0)
+    chapters = list(novel(fixtures.sdb(), count))
+    def run():
+        rng = random.Random(0)
+        for ch in chapters:
+            surface(ch, rng)
+    return run
+
+def bench_to_latex(fixtures, count=100):
+    from gen import seeded_novel, to_latex
+    chapters = list(seeded_novel(fixtures.sdb(), count, seed='benchmark'))
+    def run():
+        for ch in chapters:
+            to_latex(ch)
+    return run
+
+def bench_seeded_novel(fixtures, chapter_count=100):
+    from gen import seeded_novel
+    sdb = fixtures.sdb()
+    def run():
+        for ch in seeded_novel(sdb, chapter_count, seed='benchmark'):
+            pass
+    return run
+
+def bench_nature_sentences(fixtures):
+    from extract import nature_sentences
+    from gutenfetch import paragraphs
+    nlp = fixtures.nlp()
+    fixtures.wordnet()
+    lines = fixtures.book_lines()
+    def run():
+        list(nature_sentences(nlp, paragraphs(lines)))
+    return run
+
+def bench_wordnet_predicates(fixtures):
+    import extract
+    fixtures.wordnet()
+    predicates = [extract.lemma_is_person, extract.lemma_is_natural,
+            extract.lemma_is_physical_object,
+            extract.lemma_is_geological_formation]
+    extract.category_roots()
+    def run():
+        # from scratch every time, or only the first run would count
+        extract.lemma_cache.clear()
+        extract._closures.clear()
+        for lemma in benchmark_lemmas:
+            for predicate in predicates:
+                predicate(lemma)
+    return run
+
+def filter_costs(nlp, lines, repeat=3):
+    """what each of extract.nature_sentences' filters costs and how much it
+    rejects, over the rough sentences in lines: a list of (stage, list of
+    (name, mean seconds per sentence, fraction rejected)). unlike
+    FilterStats, every filter in a stage sees every sentence that reaches
+    the stage at all (every rough sentence for text filters, all of them
+    tagged for tagged filters, and so on), so the numbers don't depend on
+    the order the filters are in now. if nlp is None, only the text filters
+    are measured."""
+    import extract
+    from gutenfetch import paragraphs
+    texts = list(extract.rough_sentences(paragraphs(lines)))
+    stages = [('text', extract.text_filters, texts)]
+    if nlp is not None:
+        stages.append(('tagged', extract.tagged_filters,
+            [nlp(t, tag=True, parse=False, entity=False) for t in texts]))
+        stages.append(('parsed', extract.parsed_filters,
+            [s for t in texts
+                for s in nlp(t, tag=True, parse=True, entity=False).sents]))
+    costs = list()
+    for stage, filters, items in stages:
+        stage_costs = list()
+        for name, keep in filters:
+            # counting rejections first also fills any caches the filter
+            # has, as they would be most of the way through a book
+            rejected = sum(1 for item in items if not(keep(nlp, item)))
+            seconds = best_time(lambda: [keep(nlp, item) for item in items],
+                    repeat)
+            stage_costs.append((name, seconds / len(items),
+                float(rejected) / len(items)))
+        costs.append((stage, stage_costs))
+    return costs
+
+def best_filter_order(stage_costs):
+    """the names of a stage's filters (as from filter_costs) in the order
+    that rejects sentences most cheaply, assuming they reject independently:
+    the lowest cost per rejection first"""
+    def cost_per_rejection(cost):
+        name, seconds, rejected = cost
+        return seconds / rejected if rejected > 0 else float('inf')
+    return [cost[0] for cost in sorted(stage_costs, key=cost_per_rejection)]
+
+def bench_syntax(arrays=False):
+    """times get_nsubj, clauses and prep_phrases (or with arrays, the array_
+    versions, sharing one DocArrays per sentence) on each parsed fixture
+    sentence"""
+    def bench(fixtures):
+        import extract
+        nlp = fixtures.nlp()
+        sentences = [list(doc.sents)[0] for doc in
+                nlp.pipe([unicode(s) for s in fixtures.sentences()])]
+        def run():
+            for sent in sentences:
+                try:
+                    extract.get_nsubj(sent)
+                except ValueError:
+                    pass
+                for clause in extract.clauses(sent):
+                    extract.prep_phrases(clause.root)
+        def run_arrays():
+            for sent in sentences:
+                doc_arrays = extract.DocArrays(sent.doc)
+                try:
+                    extract.array_get_nsubj(sent, doc_arrays)
+                except ValueError:
+                    pass
+                for clause in extract.array_clauses(sent, doc_arrays):
+                    extract.array_prep_phrases(clause.root, doc_arrays)
+        return run_arrays if arrays else run
+    return bench
+
+def bench_postprocessing(name, reference=False):
+    """times name (normalize, punctuate, depunct or tex_escape), or with
+    reference, the implementation it replaced, over the fixture sentences"""
+    def bench(fixtures):
+        import extract, gen
+        if reference:
+            fn = globals()['reference_' + name]
+        else:
+            fn = getattr(extract, name, None) or getattr(gen, name)
+        items = (fixtures.sentences() + sample_sentences) * 50
+        if name != 'normalize':
+            items = [extract.normalize(s) for s in items]
+        def run():
+            for item in items:
+                fn(item)
+        return run
+    return bench
+
+postprocessing = ['normalize', 'punctuate', 'depunct', 'tex_escape']
+
+benchmarks = [
+    ('sentence_db', bench_sentence_db),
+    ('random_sentences', bench_random_sentences),
+    ('sentence_store', bench_sentence_store),
+    ('paragraph', bench_paragraph),
+    ('chapter', bench_chapter),
+    ('novel_10', bench_novel(10)),
+    ('novel_100', bench_novel(100)),
+    ('novel_1000', bench_novel(1000)),
+    ('seeded_novel_100', bench_seeded_novel),
+    ('surface', bench_surface),
+    ('to_latex', bench_to_latex),
+    ('nature_sentences', bench_nature_sentences),
+    ('wordnet_predicates', bench_wordnet_predicates),
+    ('syntax', bench_syntax()),
+    ('syntax_arrays', bench_syntax(True)),
+] + [(name, bench_postprocessing(name)) for name in postprocessing] + \
+    [(name + '_reference', bench_postprocessing(name, True))
+        for name in postprocessing]
+
+def run_benchmarks(fixtures, only=None, repeat=3):
+    """runs the benchmarks whose names match the regular expression only (or
+    all of them), returning a dict of name -> {'seconds': fastest run} (or
+    {'skipped': reason})"""
+    results = dict()
+    for name, bench in benchmarks:
+        if only is not None and not(re.search(only, name)):
+            continue
+        try:
+            run = bench(fixtures)
+        except Skip as e:
+            results[name] = {'skipped': str(e)}
+            sys.stderr.write("%-24s skipped (%s)\n" % (name, e))
+            continue
+        results[name] = {'seconds': best_time(run, repeat)}
+        sys.stderr.write("%-24s %10.4fs\n" % (name,
+            results[name]['seconds']))
+    return results
+
+def regressions(baseline, results, threshold=0.1):
+    """(name, baseline seconds, seconds) for each benchmark that's more than
+    threshold (a fraction) slower than it was in baseline"""
+    slower = list()
+    for name, result in sorted(results.iteritems()):
+        before = baseline.get(name, {}).get('seconds')
+        after = result.get('seconds')
+        if before is not None and after is not None and \
+                after > before * (1 + threshold):
+            slower.append((name, before, after))
+    return slower
+
+if __name__ == '__main__':
+    import argparse, json, platform
+    parser = argparse.ArgumentParser(
+            description="benchmark generation and extraction")
+    parser.add_argument('--sentences',
+            default=os.path.join(fixtures_dir, 'sentences.txt'),
+            help="file of tab-separated (source id, sentence) lines "
+            "(default fixtures/sentences.txt)")
+    parser.add_argument('--book',
+            default=os.path.join(fixtures_dir, 'book.txt'),
+            help="text to extract nature sentences from (default "
+            "fixtures/book.txt)")
+    parser.add_argument('--only', default=None, metavar='REGEX',
+            help="only run benchmarks whose names match")
+    parser.add_argument('--repeat', type=int, default=3,
+            help="runs of each benchmark; the fastest counts (default 3)")
+    parser.add_argument('--json', default=None,
+            help="save the results to this file")
+    parser.add_argument('--baseline', default=None,
+            help="compare the results to ones saved with --json")
+    parser.add_argument('--threshold', type=float, default=0.1,
+            help="fraction slower than the baseline that counts as a "
+            "regression (default 0.1)")
+    parser.add_argument('--filter-costs', action='store_true',
+            help="instead of the benchmarks, measure what each extraction "
+            "filter costs and rejects on --book, and the order each stage's "
+            "filters should be in")
+    args = parser.parse_args()
+    fixtures = Fixtures(args.sentences, args.book)
+    if args.filter_costs:
+        try:
+            nlp = fixtures.nlp()
+        except Skip as e:
+            sys.stderr.write("only measuring text filters (%s)\n" % e)
+            nlp = None
+        for stage, stage_costs in filter_costs(nlp, fixtures.book_lines(),
+                args.repeat):
+            for name, seconds, rejected in stage_costs:
+                print "%-8s %-18s %10.1fus/sentence %5.1f%% rejected" % (
+                        stage, name, seconds * 1e6, rejected * 100)
+            print "%-8s best order: %s" % (stage,
+                    ", ".join(best_filter_order(stage_costs)))
+        sys.exit(0)
+    results = run_benchmarks(fixtures, args.only, args.repeat)
+    for name in postprocessing:
+        if 'seconds' in results.get(name, {}) and \
+                'seconds' in results.get(name + '_reference', {}):
+            sys.stderr.write("%s is %.1fx the speed of the reference\n" % (
+                name, results[name + '_reference']['seconds'] /
+                results[name]['seconds']))
+    if args.json is not None:
+        with open(args.json, 'w') as fh:
+            json.dump({'python': platform.python_version(),
+                'repeat': args.repeat, 'time': time.time(),
+                'results': results}, fh, indent=2, sort_keys=True)
+    if args.baseline is not None:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)['results']
+        slower = regressions(baseline, results, args.threshold)
+        for name, before, after in slower:
+            print "regression: %s took %.4fs (was %.4fs, %+.0f%%)" % (
+                    name, after, before, (after / before - 1) * 100)
+        if len(slower) > 0:
+            sys.exit(1)
+        print "no regressions"
@@ -1,68 +1,195 @@
 import re
 import sys
+import time
+from collections import Counter
+
+import numpy
+
+# categories of noun lemmas, as bits in the mask returned by
+# lemma_categories. ALL_PROPER means all of the lemma's synsets are proper
+# nouns (and the other bits are only set for non-proper synsets).
+PERSON = 1
+NATURAL = 2
+PHYSICAL_OBJECT = 4
+GEOLOGICAL_FORMATION = 8
+ALL_PROPER = 16
+
+def make_span(doc, start, end):
+    """a spacy Span. (spacy is imported on demand, so that loading this module
+    doesn't load all of spacy with it.)"""
+    from spacy.tokens import Span
+    return Span(doc, start, end)
+
+# WordNet is slow to load, and isn't needed at all when lemma categories come
+# from a precompiled table (see use_lexicon), so it's imported on demand.
+_wordnet = None
+def wordnet_module():
+    "pattern's WordNet module, imported the first time it's needed"
+    global _wordnet
+    if _wordnet is None:
+        from pattern.en import wordnet
+        _wordnet = wordnet
+    return _wordnet
+
+_category_roots = None
+def category_roots():
+    """list of (category, synset ids) pairs: a synset belongs to the category
+    if it (or one of its hypernyms) is one of those synsets."""
+    global _category_roots
+    if _category_roots is None:
+        wordnet = wordnet_module()
+        Synset = wordnet.Synset
+        nature_synsets = [Synset(u'natural object'), Synset(u'body of water'),
+                Synset(u'geological formation'), Synset(u'location'),
+                Synset(u'shape'), Synset(u'natural phenomenon'),
+                Synset(u'land')]
+        _category_roots = [
+            (PERSON, frozenset([wordnet.synsets('person')[0].id])),
+            (NATURAL, frozenset([ss.id for ss in nature_synsets])),
+            (PHYSICAL_OBJECT,
+                frozenset([wordnet.synsets('physical object')[0].id])),
+            (GEOLOGICAL_FORMATION,
+                frozenset([wordnet.synsets('geological_formation')[0].id])),
+        ]
+    return _category_roots
+
+# ids of each synset along with all of its hypernyms. (there are only so
+# many synsets in WordNet, so this doesn't need to be bounded.)
+_closures = dict()
+def synset_closure(synset):
+    "set of the ids of synset and all of its hypernyms"
+    try:
+        return _closures[synset.id]
+    except KeyError:
+        closure = frozenset([synset.id] +
+                [h.id for h in synset.hypernyms(recursive=True)])
+        _closures[synset.id] = closure
+        return closure
+
+def synset_categories(synset):
+    "bitmask of the categories that the synset belongs to"
+    closure = synset_closure(synset)
+    mask = 0
+    for category, ids in category_roots():
+        if not(ids.isdisjoint(closure)):
+            mask |= category
+    return mask
 
-from pattern.en import parsetree, wordnet, article
-from pattern.text.en.wordnet import Synset
-from spacy.tokens import Span
-
-person_ss = wordnet.synsets('person')[0]
 def synset_is_person(synset):
-    hypernyms = synset.hypernyms(recursive=True)
-    return synset == person_ss or person_ss in hypernyms
+    return bool(synset_categories(synset) & PERSON)
 
 def synset_is_proper(synset):
     return any([syn[0].isupper() for syn in synset.synonyms])
 
-physical_object_ss = wordnet.synsets('physical object')[0]
 def synset_is_physical_object(synset):
-    hypernyms = synset.hypernyms(recursive=True)
-    return synset == physical_object_ss or physical_object_ss in hypernyms
+    return bool(synset_categories(synset) & PHYSICAL_OBJECT)
 
 def lemma_is_physical_object(lemma):
-    synsets = wordnet.synsets(lemma, wordnet.NOUN)
-    if len(synsets) > 0 and all([synset_is_proper(s) for s in synsets]):
-        return False
-    else:
-        return any([synset_is_physical_object(s) for s in synsets \
-                if not(synset_is_proper(s))])
+    return bool(lemma_categories(lemma) & PHYSICAL_OBJECT)
 
-formation_ss = wordnet.synsets('geological_formation')[0]
 def synset_is_geological_formation(synset):
-    hypernyms = synset.hypernyms(recursive=True)
-    return synset == formation_ss or formation_ss in hypernyms
+    return bool(synset_categories(synset) & GEOLOGICAL_FORMATION)
 
 def lemma_is_geological_formation(lemma):
-    synsets = wordnet.synsets(lemma, wordnet.NOUN)
-    if len(synsets) > 0 and all([synset_is_proper(s) for s in synsets]):
-        return False
-    else:
-        return any([synset_is_geological_formation(s) for s in synsets \
-                if not(synset_is_proper(s))])
+    return bool(lemma_categories(lemma) & GEOLOGICAL_FORMATION)
 
-nature_synsets = [Synset(u'natural object'), Synset(u'body of water'),
-        Synset(u'geological formation'), Synset(u'location'), Synset(u'shape'),
-        Synset(u'natural phenomenon'), Synset(u'land')]
 def synset_is_natural(synset):
-    hypernyms = synset.hypernyms(recursive=True)
-    return synset in nature_synsets or any([h in nature_synsets for h in
-        hypernyms])
+    return bool(synset_categories(synset) & NATURAL)
+
 def lemma_is_natural(lemma):
-    synsets = wordnet.synsets(lemma, wordnet.NOUN)
-    if len(synsets) > 0 and all([synset_is_proper(s) for s in synsets]):
-        return False
-    else:
-        return any([synset_is_natural(s) for s in synsets \
-                if not(synset_is_proper(s))])
+    return bool(lemma_categories(lemma) & NATURAL)
 
 def lemma_is_person(lemma):
-    synsets = wordnet.synsets(lemma, wordnet.NOUN)
     # if ALL the synsets are proper, then it's a person!
-    if len(synsets) > 0 and all([synset_is_proper(s) for s in synsets]):
-        return True
-    # otherwise, check ONLY the non-proper synsets
+    return bool(lemma_categories(lemma) & (PERSON | ALL_PROPER))
+
+def classify_lemma(lemma):
+    """computes the category mask for a noun lemma from WordNet (see
+    lemma_categories)."""
+    wordnet = wordnet_module()
+    synsets = wordnet.synsets(lemma, wordnet.NOUN)
+    # check ONLY the non-proper synsets
+    common = [s for s in synsets if not(synset_is_proper(s))]
+    mask = 0
+    if len(synsets) > 0 and len(common) == 0:
+        mask |= ALL_PROPER
+    for s in common:
+        mask |= synset_categories(s)
+    return mask
+
+class LemmaCache(object):
+    """a bounded cache for lemma categories. entries live in two
+    generations: when the current generation fills up, the old one is
+    dropped and the current one takes its place, so lemmas that keep coming
+    up stay cached (a cheap approximation of least-recently-used)."""
+    def __init__(self, maxsize=50000):
+        self.maxsize = maxsize
+        self.current = dict()
+        self.old = dict()
+        self.hits = 0
+        self.misses = 0
+    def get(self, key):
+        "returns the cached value for key, or None"
+        if key in self.current:
+            self.hits += 1
+            return self.current[key]
+        if key in self.old:
+            self.hits += 1
+            value = self.old.pop(key)
+            self.put(key, value)
+            return value
+        self.misses += 1
+        return None
+    def put(self, key, value):
+        if len(self.current) >= self.maxsize:
+            self.old = self.current
+            self.current = dict()
+        self.current[key] = value
+    def clear(self):
+        self.current = dict()
+        self.old = dict()
+        self.hits = 0
+        self.misses = 0
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self.current) + len(self.old),
+                'maxsize': self.maxsize}
+
+lemma_cache = LemmaCache()
+lemma_table = None
+def lemma_categories(lemma):
+    """bitmask of the categories (PERSON, NATURAL, PHYSICAL_OBJECT,
+    GEOLOGICAL_FORMATION, ALL_PROPER) that the noun lemma belongs to. results
+    are kept in lemma_cache, and come from the table loaded with use_lexicon
+    (if any) or else from WordNet."""
+    mask = lemma_cache.get(lemma)
+    if mask is None:
+        if lemma_table is not None:
+            mask = lemma_table.get(lemma)
+        else:
+            mask = classify_lemma(lemma)
+        lemma_cache.put(lemma, mask)
+    return mask
+
+def use_lexicon(path):
+    """look up lemma categories in a table built with lexicon.py, instead of
+    in WordNet. (pass None to go back to WordNet.)"""
+    global lemma_table
+    if path is None:
+        lemma_table = None
     else:
-        return any([synset_is_person(s) for s in synsets \
-                if not(synset_is_proper(s))])
+        import lexicon
+        lemma_table = lexicon.Lexicon(path)
+    lemma_cache.clear()
+
+# bump this when the filters in nature_sentences change, so that books
+# extracted with the old filters get extracted again
+EXTRACTION_VERSION = 2
+
+def parser_version():
+    "version of the parser, for keying anything derived from its output"
+    import pkg_resources
+    return "spacy-" + pkg_resources.get_distribution('spacy').version
 
 def sentences_with_lemmata(nlp, s):
     return list(nlp(s).sents)
@@ -84,14 +211,24 @@ def get_pronouns(nlp, sentence):
         if word.tag in (PRP, PRPS):
             yield word
 
-def has_people(nlp, s):
+def has_proper_nouns(nlp, s):
     NNP = nlp.vocab.strings['NNP']
-    any_proper_nouns = any([word.tag == NNP for word in s])
-    any_caps = any([word.string[0].isupper() for word in s[1:]])
-    any_person_nouns = any([lemma_is_person(nn.lemma_) \
-            for nn in get_nouns(nlp, s)])
-    any_not_its = any([prp.lemma_ not in ('it', 'its') for prp in get_pronouns(nlp, s)])
-    return any_person_nouns or any_not_its or any_proper_nouns or any_caps
+    return any(word.tag == NNP for word in s)
+
+def has_caps(nlp, s):
+    "any capitalized words (other than the first)?"
+    return any(word.string[0].isupper() for word in s[1:])
+
+def has_person_nouns(nlp, s):
+    return any(lemma_is_person(nn.lemma_) for nn in get_nouns(nlp, s))
+
+def has_pronouns_besides_it(nlp, s):
+    return any(prp.lemma_ not in ('it', 'its') for prp in get_pronouns(nlp, s))
+
+def has_people(nlp, s):
+    # cheapest checks first
+    return has_proper_nouns(nlp, s) or has_caps(nlp, s) or \
+            has_pronouns_besides_it(nlp, s) or has_person_nouns(nlp, s)
 
 def physical_object_count(nlp, s):
     nns = get_nouns(nlp, s)
@@ -109,6 +246,7 @@ def has_pronoun_subject(nlp, s):
 
 def hypernym_chains(lemma):
     chains = []
+    wordnet = wordnet_module()
     synsets = wordnet.synsets(lemma, pos=wordnet.NOUN)
     for synset in synsets:
         chains.append(synset.hypernyms(recursive=True))
@@ -138,11 +276,112 @@ def subjects_are_natural(sentence):
     return len(subj_head_lemmas) > 0 and \
             all([lemma_is_natural(lem) for lem in subj_head_lemmas])
 
+class DocArrays(object):
+    """a parsed Doc's heads, dependency labels and tags, exported once as
+    arrays, along with what array_get_nsubj, array_clauses and
+    array_prep_phrases need to know about the tree, worked out in one pass over it: each token's children,
+    the extent of its subtree, its position in a preorder walk of the tree
+    (so that "is x in y's subtree" is a comparison) and whether it, or one
+    of its ancestors, is the subject of a clause (as dep_to_root would
+    say)."""
+    def __init__(self, doc):
+        from spacy.attrs import HEAD, DEP, TAG
+        self.doc = doc
+        n = len(doc)
+        arr = doc.to_array([HEAD, DEP, TAG]).astype(numpy.int64)
+        # heads are stored relative to each token
+        heads = numpy.arange(n) + arr[:, 0]
+        deps = arr[:, 1]
+        tags = arr[:, 2]
+        strings = doc.vocab.strings
+        def labelled(*labels):
+            return numpy.in1d(deps, [strings[label] for label in labels])
+        self.is_prep = labelled(u'prep').tolist()
+        tag_ids, tag_index = numpy.unique(tags, return_inverse=True)
+        is_verb = numpy.array([strings[int(t)].startswith('VB')
+            for t in tag_ids], dtype=bool)[tag_index]
+        self.is_clause = (labelled(u'ccomp', u'conj') & is_verb).tolist()
+        self.is_trimmed = labelled(u'punct', u'cc').tolist()
+        is_subj = labelled(u'nsubj', u'nsubjpass').tolist()
+        is_root = labelled(u'ROOT').tolist()
+        # children of each token, in order
+        order = numpy.argsort(heads, kind='mergesort')
+        bounds = numpy.searchsorted(heads[order], numpy.arange(n + 1))
+        order = order.tolist()
+        bounds = bounds.tolist()
+        heads = heads.tolist()
+        self.kids = [[c for c in order[bounds[i]:bounds[i+1]] if c != i]
+                for i in range(n)]
+        # preorder walk from each root (a token that's its own head)
+        preorder = list()
+        stack = [i for i in reversed(range(n)) if heads[i] == i]
+        while stack:
+            i = stack.pop()
+            preorder.append(i)
+            stack.extend(reversed(self.kids[i]))
+        self.pre = [n] * n
+        for pos, i in enumerate(preorder):
+            self.pre[i] = pos
+        # parents come before their children...
+        self.subj_chain = [False] * n
+        for i in preorder:
+            head = heads[i]
+            self.subj_chain[i] = is_subj[i] or \
+                    (head != i and not(is_root[head]) and
+                            self.subj_chain[head])
+        # ...and after them, going backwards
+        self.size = [1] * n
+        self.left = range(n)
+        self.right = range(1, n + 1)
+        for i in reversed(preorder):
+            head = heads[i]
+            if head != i:
+                self.size[head] += self.size[i]
+                self.left[head] = min(self.left[head], self.left[i])
+                self.right[head] = max(self.right[head], self.right[i])
+        self.subj_chain = numpy.array(self.subj_chain, dtype=bool)
+        self.pre_array = numpy.array(self.pre)
+
+    def in_subtree(self, root, start, end):
+        "boolean array: for each token from start to end, is it under root?"
+        pre = self.pre_array[start:end]
+        return (pre >= self.pre[root]) & (pre < self.pre[root] +
+                self.size[root])
+
+    def trim(self, start, end):
+        """like trim_tokens: (start, end) without leading and trailing
+        punctuation and conjunctions, or None if that isn't a span"""
+        trimmed_start = start
+        while trimmed_start < end and self.is_trimmed[trimmed_start]:
+            trimmed_start += 1
+        trimmed_end = end
+        while trimmed_end > start and self.is_trimmed[trimmed_end - 1]:
+            trimmed_end -= 1
+        if trimmed_start > trimmed_end:
+            return None
+        return trimmed_start, trimmed_end
+
 def dep_to_root(token):
     if token.head.dep_ == 'ROOT': return [token.dep_]
     return [token.dep_] + dep_to_root(token.head)
 
+def array_get_nsubj(sentence, arrays=None):
+    """get_nsubj, working from a DocArrays for sentence's document (built
+    here if arrays is None; pass one in to share it between calls)"""
+    if arrays is None:
+        arrays = DocArrays(sentence.doc)
+    start, end = sentence.start, sentence.end
+    found = numpy.flatnonzero(arrays.subj_chain[start:end] &
+            arrays.in_subtree(sentence.root.i, start, end))
+    if len(found) == 0:
+        raise ValueError
+    return make_span(sentence.doc, start + int(found[0]),
+            start + int(found[-1]) + 1)
+
 def get_nsubj(sentence):
+    """the span from the first to the last token in sentence (under its root)
+    that is, or is part of, the subject of a clause. raises ValueError if
+    there isn't one."""
     nsubj = list()
     for i, token in enumerate(sentence.root.subtree):
         deps = dep_to_root(token)
@@ -151,7 +390,7 @@ def get_nsubj(sentence):
             nsubj.append(token.i)
     if len(nsubj) == 0:
         raise ValueError
-    nsubj_span = Span(sentence.doc, min(nsubj), max(nsubj)+1)
+    nsubj_span = make_span(sentence.doc, min(nsubj), max(nsubj)+1)
     return nsubj_span
 
 def replace_span(sentence, span, s):
@@ -186,9 +425,9 @@ def span_subtract(whole, part):
     if part.start > whole.end or part.end < whole.start:
         return whole
     if part.start <= whole.start:
-        return Span(whole.doc, part.end, whole.end)
+        return make_span(whole.doc, part.end, whole.end)
     else:
-        return Span(whole.doc, whole.start, part.start)
+        return make_span(whole.doc, whole.start, part.start)
 
 def trim_tokens(span, tokens=None):
     if tokens is None:
@@ -205,9 +444,60 @@ def trim_tokens(span, tokens=None):
             end = span.end - (i+1)
         else:
             break
-    return Span(span.doc, start, end)
+    return make_span(span.doc, start, end)
+
+def array_clauses(sentence, arrays=None):
+    """clauses, working from a DocArrays for sentence's document (built here
+    if arrays is None)"""
+    if arrays is None:
+        arrays = DocArrays(sentence.doc)
+    extents = clause_extents(arrays, sentence.root.i, sentence.start,
+            sentence.end)
+    if extents is None:
+        # the parse is odd enough that clauses makes an invalid span
+        # somewhere along the way, so let it
+        return clauses(sentence)
+    return [make_span(sentence.doc, start, end) for start, end in extents]
+
+def clause_extents(arrays, root, start, end):
+    """(start, end) of each of the clauses that clauses would return for the
+    span from start to end (whose root is root), or None if clauses would
+    try to make a span that ends before it starts."""
+    # (children at end are checked too, as clauses does)
+    ccomps = [child for child in arrays.kids[root]
+            if start <= child <= end and arrays.is_clause[child]]
+    if len(ccomps) == 0:
+        trimmed = arrays.trim(start, end)
+        if trimmed is None:
+            return None
+        return [trimmed]
+    results = list()
+    rest_start, rest_end = start, end
+    for child in ccomps:
+        part_start, part_end = arrays.left[child], arrays.right[child]
+        # span_subtract
+        if not(part_start > rest_end or part_end < rest_start):
+            if part_start <= rest_start:
+                rest_start = part_end
+            else:
+                rest_end = part_start
+            if rest_start > rest_end:
+                return None
+        part_root = make_span(arrays.doc, part_start, part_end).root.i
+        extents = clause_extents(arrays, part_root, part_start, part_end)
+        if extents is None:
+            return None
+        results.extend(extents)
+    trimmed = arrays.trim(rest_start, rest_end)
+    if trimmed is None:
+        return None
+    results.append(trimmed)
+    return results
 
 def clauses(sentence, i=""):
+    """splits sentence into clauses: each verb that's a ccomp or conj of the
+    root is split off (with its subtree) and split into clauses itself, and
+    what's left is the main clause."""
     root = sentence.root
     results = list()
     ccomps = list()
@@ -216,10 +506,11 @@ def clauses(sentence, i=""):
         if sentence.start <= child.i <= sentence.end:
             if child.dep_ in ('ccomp', 'conj') and child.tag_.startswith('VB'):
                 ccomps.append(child)
-    rest_span = Span(sentence.doc, sentence.start, sentence.end)
+    rest_span = make_span(sentence.doc, sentence.start, sentence.end)
     if len(ccomps) > 0:
         for child in ccomps:
-            ccomp_span = Span(sentence.doc, *subtree_extent(child.subtree))
+            ccomp_span = make_span(sentence.doc,
+                    *subtree_extent(child.subtree))
             rest_span = span_subtract(rest_span, ccomp_span)
             results.extend(clauses(ccomp_span, i+">"))
         results.append(trim_tokens(rest_span))
@@ -230,9 +521,18 @@ def clauses(sentence, i=""):
 def span_from_token_seq(tokens):
     tlist = list(tokens)
     """FIXME: assert that all of the tokens belong to the same document?"""
-    return Span(tlist[0].doc, *subtree_extent(tlist))
+    return make_span(tlist[0].doc, *subtree_extent(tlist))
+
+def array_prep_phrases(root, arrays=None):
+    """prep_phrases, working from a DocArrays for root's document (built here
+    if arrays is None)"""
+    if arrays is None:
+        arrays = DocArrays(root.doc)
+    return [make_span(root.doc, arrays.left[child], arrays.right[child])
+            for child in arrays.kids[root.i] if arrays.is_prep[child]]
 
 def prep_phrases(root):
+    "the subtree of each of root's prep children"
     phrases = list()
     for child in root.children:
         if child.dep_ == 'prep':
@@ -240,6 +540,7 @@ def prep_phrases(root):
     return phrases
 
 def indefify(span):
+    from pattern.en import article
     # find that article (will raise IndexError, watch out)
     det = [t for t in span.root.children \
             if t.dep_ == 'det' and t.lower_ in ('the', 'this', 'these')][0]
@@ -259,33 +560,63 @@ def indefify(span):
             output.append(t.orth_)
     return " ".join(output)
 
+def tidy_parens(match):
+    if match.group(1) is None:
+        return ')'
+    return '(' + match.group(1) + ')'
+
+# the steps of normalize, in order, as (trigger, pattern, replacement). a step
+# is skipped unless at least one of the characters in trigger is in the
+# string. patterns are compiled regular expressions, or plain strings to
+# replace with str.replace.
+normalize_steps = [
+    ("\r\n", re.compile("[\r\n]+"), " "),
+    ("'", "others '", "others'"),
+    ("'\"`_", re.compile(r'(^|\s+)[\'"`_](\s+|$)'), ' '),
+    (".,;:!?", re.compile(r"\s([.,;:!?])(\s|$)"), r"\1 "),
+    ("'", re.compile(r"\s*'s"), "'s"),
+    ("i", re.compile(r'\bi\b'), 'I'),
+    # no space just inside parentheses, or before any other closing
+    # parenthesis
+    (")", re.compile(r'\(\s*([^)]*?)\s*\)|\s*\)'), tidy_parens),
+    ("-", "--", u"\u2014"),
+    ("{", "{", ""),
+    ("}", "}", ""),
+    ("-", " - ", "-"),
+    ("_", "_", ""),
+]
+
 def normalize(s):
     s = s.lower().strip()
-    s = re.sub("[\r\n]+", " ", s)
-    s = re.sub(r"others '", "others'", s)
-    s = re.sub(r'(^|\s+)[\'"`_](\s+|$)', ' ', s)
-    s = re.sub(r"\s([.,;:!?])(\s|$)", r"\1 ", s)
-    s = re.sub(r"\s*'s", "'s", s)
-    s = re.sub(r'\bi\b', 'I', s)
-    s = re.sub(r'\(\s*([^)]*)\)', r'(\1)', s)
-    s = re.sub(r'\s*\)', ')', s)
-    s = re.sub(r'--', u"\u2014", s)
-    s = re.sub(r'[{}]', '', s)
-    s = re.sub(r' - ', '-', s)
-    s = re.sub(r'_', '', s)
+    for trigger, pattern, replacement in normalize_steps:
+        for ch in trigger:
+            if ch in s:
+                break
+        else:
+            continue
+        if isinstance(pattern, basestring):
+            s = s.replace(pattern, replacement)
+        else:
+            s = pattern.sub(replacement, s)
     if ')' in s and '(' not in s:
         s = s.replace(')', '')
     if '(' in s and ')' not in s:
         s = s.replace('(', '')
     return ucfirst(s)
 
+def ends_with_punct(s):
+    "like re.search(r'[.!?]$', s) (so a final newline is skipped)"
+    if s.endswith("\n"):
+        s = s[:-1]
+    return len(s) > 0 and s[-1] in ".!?"
+
 def punctuate(s):
-    if not(re.search(r"[.!?]$", s)):
+    if not(ends_with_punct(s)):
         s += "."
     return s
 
 def depunct(s):
-    if re.search(r"[.!?]$", s):
+    if ends_with_punct(s):
         return s[:-1]
     else:
         return s
@@ -293,16 +624,190 @@ def depunct(s):
 def ucfirst(s):
     return s[0].upper() + s[1:]
 
-def nature_sentences(nlp, s):
-    for sentence in sentences_with_lemmata(nlp, s):
-        if not(has_people(nlp, sentence)) and \
-                subjects_are_natural(sentence) and \
-                not(has_pronoun_subject(nlp, sentence)) and \
-                sentence_is_past(sentence) and \
-                len(sentence.text) > 20 and \
-                len(sentence.text) < 140:
+# nature_sentences runs its filters in three stages, cheapest first, and each
+# stage only sees what made it through the one before. within each stage,
+# filters are (name, function) pairs; a function returns True if the
+# sentence should be kept. python benchmark.py --filter-costs measures what
+# each filter costs and rejects, and the order that rejects sentences most
+# cheaply. only the text filters' order comes from that (measured on
+# fixtures/book.txt); the tagged and parsed filters, which need spaCy to
+# measure, haven't been measured, and their order is a guess.
+
+# rough sentences: regular expression-based segmentation of the raw text,
+# before anything is parsed
+# bump ROUGH_SPLIT_VERSION when rough_sentence_break or rough_sentences
+# change, so that parses cached from the old rough sentences aren't used
+ROUGH_SPLIT_VERSION = 1
+rough_sentence_break = re.compile(r'(?:(?<=[.!?])|(?<=[.!?]["\')\]]))\s+')
+
+_mid_sentence_caps = None
+def has_mid_sentence_caps(text):
+    """any capitalized words (other than the first)? the same check as
+    has_caps, on the text: an uppercase character (any uppercase character
+    in the Basic Multilingual Plane, not just A-Z) at the start of a word."""
+    global _mid_sentence_caps
+    if _mid_sentence_caps is None:
+        # compiled the first time it's needed, to keep importing quick
+        uppercase = list()
+        for i in range(0x10000):
+            if unichr(i).isupper():
+                if uppercase and uppercase[-1][1] == i - 1:
+                    uppercase[-1][1] = i
+                else:
+                    uppercase.append([i, i])
+        _mid_sentence_caps = re.compile(u'(?<=\\W)[%s]' % u''.join(
+            re.escape(unichr(start)) + u'-' + re.escape(unichr(end))
+            for start, end in uppercase), re.U)
+    return _mid_sentence_caps.search(text) is not None
+
+text_filters = [
+    ('length', lambda nlp, text: 20 < len(text) < 140),
+    ('capitals', lambda nlp, text: not(has_mid_sentence_caps(text))),
+    ('quotes', lambda nlp, text: not(re.search(u'["\u201c\u201d]', text))),
+]
+
+# tokenized and tagged, but not parsed
+tagged_filters = [
+    ('proper nouns', lambda nlp, s: not(has_proper_nouns(nlp, s))),
+    ('pronouns', lambda nlp, s: not(has_pronouns_besides_it(nlp, s))),
+    ('person nouns', lambda nlp, s: not(has_person_nouns(nlp, s))),
+]
+
+# parsed sentences
+parsed_filters = [
+    ('length', lambda nlp, s: 20 < len(s.text) < 140),
+    ('past tense', lambda nlp, s: sentence_is_past(s)),
+    ('pronoun subject', lambda nlp, s: not(has_pronoun_subject(nlp, s))),
+    ('natural subjects', lambda nlp, s: subjects_are_natural(s)),
+]
+
+class FilterStats(object):
+    """how many sentences each of nature_sentences' filters rejected, and how
+    much time was spent in each one (the text filters together), and in
+    tagging, parsing and reading parses from a cache."""
+    def __init__(self):
+        self.candidates = 0
+        self.kept = 0
+        self.rejected = Counter()
+        self.seconds = Counter()
+
+    def update(self, other):
+        self.candidates += other.candidates
+        self.kept += other.kept
+        self.rejected.update(other.rejected)
+        self.seconds.update(other.seconds)
+
+    def report(self):
+        lines = ["%d candidate sentences, %d kept" % (
+            self.candidates, self.kept)]
+        for name, keep in text_filters:
+            key = "text: " + name
+            lines.append("%s: rejected %d" % (key, self.rejected[key]))
+        for stage, filters in [('tagged', tagged_filters),
+                ('parsed', parsed_filters)]:
+            for name, keep in filters:
+                key = stage + ": " + name
+                lines.append("%s: rejected %d (%.2fs)" % (
+                    key, self.rejected[key], self.seconds[key]))
+        for key in ('text filters', 'tagging', 'parsing', 'reading cache'):
+            lines.append("%s: %.2fs" % (key, self.seconds[key]))
+        return "\n".join(lines)
+
+def passes(stage, filters, nlp, s, stats, timed=True):
+    """whether s gets through all of filters, counting the one that rejects
+    it (if any) in stats, along with (if timed) the time spent in each"""
+    for name, keep in filters:
+        if timed:
+            start = time.time()
+            kept = keep(nlp, s)
+            stats.seconds[stage + ": " + name] += time.time() - start
+        else:
+            kept = keep(nlp, s)
+        if not(kept):
+            stats.rejected[stage + ": " + name] += 1
+            return False
+    return True
+
+def passes_text_filters(nlp, text, stats):
+    # the text filters take well under a microsecond each, so they're timed
+    # as a whole; timing each of them would cost more than running them
+    start = time.time()
+    kept = passes('text', text_filters, nlp, text, stats, timed=False)
+    stats.seconds['text filters'] += time.time() - start
+    return kept
+
+def nature_sentences(nlp, s, stats=None):
+    """yields the sentences in s that are about nature. s is either a string
+    or an iterable of strings (e.g., paragraphs from
+    gutenfetch.iter_iso_text), which are processed one at a time. cheap
+    checks on the text go first, and only the rough sentences that pass
+    them are tagged, and only the ones that pass the tag-based checks are
+    parsed (see text_filters etc. above). if stats (a FilterStats) is
+    given, the number of sentences that each filter rejected is added to
+    it."""
+    if stats is None:
+        stats = FilterStats()
+    for text in rough_sentences(s):
+        stats.candidates += 1
+        if not(passes_text_filters(nlp, text, stats)):
+            continue
+        start = time.time()
+        doc = nlp(text, tag=True, parse=False, entity=False)
+        stats.seconds['tagging'] += time.time() - start
+        if not(passes('tagged', tagged_filters, nlp, doc, stats)):
+            continue
+        start = time.time()
+        nlp.parser(doc)
+        stats.seconds['parsing'] += time.time() - start
+        for sentence in parsed_nature_sentences(nlp, doc, stats):
+            yield sentence
+
+def rough_sentences(s):
+    """the rough sentences (see rough_sentence_break) in s, a string or an
+    iterable of strings"""
+    if isinstance(s, basestring):
+        s = [s]
+    for chunk in s:
+        for text in rough_sentence_break.split(chunk.strip()):
+            yield text
+
+def parsed_nature_sentences(nlp, doc, stats):
+    "the last stage of nature_sentences, for a parsed rough sentence"
+    for sentence in doc.sents:
+        if passes('parsed', parsed_filters, nlp, sentence, stats):
+            stats.kept += 1
             yield ucfirst(normalize(sentence.text))
 
+def parse_rough_sentences(nlp, s, stats=None):
+    """yields a parsed doc for each rough sentence in s (as nature_sentences
+    would split it), whether or not it would get through any of the
+    filters, so that the parses can be saved and filtered later (see
+    filter_parsed)."""
+    if stats is None:
+        stats = FilterStats()
+    for text in rough_sentences(s):
+        start = time.time()
+        doc = nlp(text, tag=True, parse=True, entity=False)
+        stats.seconds['parsing'] += time.time() - start
+        yield doc
+
+def filter_parsed(nlp, docs, stats=None):
+    """yields the same sentences as nature_sentences would, but from docs,
+    the parsed rough sentences from parse_rough_sentences, so nothing needs
+    to be tagged or parsed again. the filters run in the same stages and
+    order as in nature_sentences, so stats come out the same (apart from
+    the time spent tagging and parsing)."""
+    if stats is None:
+        stats = FilterStats()
+    for doc in docs:
+        stats.candidates += 1
+        if not(passes_text_filters(nlp, doc.text, stats)):
+            continue
+        if not(passes('tagged', tagged_filters, nlp, doc, stats)):
+            continue
+        for sentence in parsed_nature_sentences(nlp, doc, stats):
+            yield sentence
+
 def main(nlp, s):
     import sys, os
     for sentence in sentences_with_lemmata(nlp, s):
@@ -1,30 +1,291 @@
-import re
+import multiprocessing
+import os
 import sys
+import time
+import traceback
 
 import extract
 import gutenfetch
 
-def main(nlp):
+def matching_book_ids():
     subjs = 'Western|Science fiction|Geology|Natural|Exploration|Discovery|Physical'
-    book_ids = [r['gutenberg_id'] for r in \
-            gutenfetch.search(
-                lambda x: any([re.search(subjs, t['identifier'], re.I) for t \
-                        in x['subjects']]))]
-    for book_id in book_ids:
-        sys.stderr.write("current book: " + str(book_id) + "\n")
-        try:
-            text = gutenfetch.get_iso_text(book_id)
-            for sentence in extract.nature_sentences(nlp, text):
+    return gutenfetch.load_index().subject_ids(subjs)
+
+# a parse cache file holds every rough sentence of a book, parsed (see
+# extract.parse_rough_sentences): a line identifying the format and the
+# parser, followed by each doc as serialized by Doc.to_bytes. docs can only
+# be read back with the same version of spacy (and its data) that wrote
+# them, and only match what nature_sentences would parse if the text was
+# split into rough sentences the same way, so caches from any other version
+# of either are ignored.
+PARSE_CACHE_FORMAT = "PARSE1"
+
+def parse_cache_header():
+    return "%s %s rough-%d\n" % (PARSE_CACHE_FORMAT, extract.parser_version(),
+            extract.ROUGH_SPLIT_VERSION)
+
+def parse_cache_path(cache_dir, book_id):
+    return os.path.join(cache_dir, str(book_id) + ".docs")
+
+def read_parse_cache(nlp, path, stats=None):
+    """the docs in the parse cache file at path, or None if there isn't one
+    (or it was written by a different parser). the docs are read one at a
+    time as they're used, so that a whole parsed book is never in memory at
+    once; the file stays open until the last one has been read. the time
+    spent reading them is added to stats (an extract.FilterStats), if it's
+    given."""
+    try:
+        fh = open(path, 'rb')
+    except IOError:
+        return None
+    if fh.readline() != parse_cache_header():
+        fh.close()
+        return None
+    return cached_docs(nlp, fh, stats)
+
+def cached_docs(nlp, fh, stats=None):
+    from spacy.tokens import Doc
+    if stats is None:
+        stats = extract.FilterStats()
+    with fh:
+        docs = Doc.read_bytes(fh)
+        while True:
+            start = time.time()
+            try:
+                doc = Doc(nlp.vocab).from_bytes(next(docs))
+            except StopIteration:
+                return
+            finally:
+                stats.seconds['reading cache'] += time.time() - start
+            yield doc
+
+def write_parse_cache(path, docs):
+    """yields each of docs, after writing it to a parse cache file at path.
+    the file is only put in place once the last doc has been written; if
+    anything goes wrong before then (or the docs aren't all used), it's
+    removed."""
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, 'wb') as fh:
+            fh.write(parse_cache_header())
+            for doc in docs:
+                fh.write(doc.to_bytes())
+                yield doc
+        os.rename(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def book_sentences(nlp, book_id, cache_dir=None):
+    """returns (book_id, list of nature sentences, error message,
+    extract.FilterStats). if the book can't be fetched, the list is empty
+    and the message says why. with cache_dir, the book's parse is read from
+    the parse cache there instead, if it's been cached; if not, every rough
+    sentence in the book is parsed and cached (which takes longer than
+    extract.nature_sentences, which only parses the sentences that get
+    through the cheaper filters) so that later runs only need to filter."""
+    stats = extract.FilterStats()
+    try:
+        if cache_dir is None:
+            text = gutenfetch.iter_iso_text(book_id)
+            sentences = list(extract.nature_sentences(nlp, text, stats))
+            return book_id, sentences, None, stats
+        path = parse_cache_path(cache_dir, book_id)
+        docs = read_parse_cache(nlp, path, stats)
+        if docs is None:
+            text = gutenfetch.iter_iso_text(book_id)
+            docs = write_parse_cache(path,
+                    extract.parse_rough_sentences(nlp, text, stats))
+        sentences = list(extract.filter_parsed(nlp, docs, stats))
+        return book_id, sentences, None, stats
+    except ValueError as e:
+        return book_id, [], str(e), stats
+
+_worker_nlp = None
+_worker_cache_dir = None
+def _init_worker(lexicon, cache_dir):
+    global _worker_nlp, _worker_cache_dir
+    from spacy.en import English
+    if lexicon is not None:
+        extract.use_lexicon(lexicon)
+    _worker_nlp = English(data_dir=os.environ.get('SPACY_DATA'))
+    _worker_cache_dir = cache_dir
+
+def safe_book_sentences(nlp, book_id, cache_dir=None):
+    """book_sentences, but any exception (not just a book that can't be
+    fetched) becomes the book's error message, so that one bad book doesn't
+    stop the extraction"""
+    try:
+        return book_sentences(nlp, book_id, cache_dir)
+    except Exception:
+        return book_id, [], traceback.format_exc(), extract.FilterStats()
+
+def _worker_book_sentences(book_id):
+    return safe_book_sentences(_worker_nlp, book_id, _worker_cache_dir)
+
+def extraction_stamp():
+    """identifies the parser and filters used to extract a book's sentences,
+    so that books extracted with anything different can be redone."""
+    return extract.parser_version() + "/" + str(extract.EXTRACTION_VERSION)
+
+def read_manifest(path):
+    "dict of book id -> (sentence count, stamp) from the manifest at path"
+    manifest = dict()
+    if os.path.exists(path):
+        with open(path) as fh:
+            for line in fh:
+                if not(line.endswith("\n")):
+                    break # torn write
+                book_id, count, stamp = line.rstrip("\n").split("\t")
+                manifest[book_id] = (int(count), stamp)
+    return manifest
+
+def rewrite(path, lines):
+    "replace the contents of path with lines, all at once"
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as fh:
+        for line in lines:
+            fh.write(line)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.rename(tmp, path)
+
+class Checkpoint(object):
+    """output file for an extraction that can be resumed. sentences are
+    appended to the output one book at a time; once a book is safely on
+    disk, its id, sentence count and extraction stamp are appended to a
+    manifest (path + ".manifest"). when resuming, output from books that
+    aren't in the manifest (or that were extracted with a different stamp)
+    is thrown away, and the books listed in self.done can be skipped. stamp
+    is the extraction stamp for this run (default extraction_stamp())."""
+    def __init__(self, path, resume=False, stamp=None):
+        self.path = path
+        self.manifest_path = path + ".manifest"
+        if stamp is None:
+            stamp = extraction_stamp()
+        self.stamp = stamp
+        self.done = dict()
+        if resume:
+            self.recover()
+        else:
+            rewrite(self.path, [])
+            rewrite(self.manifest_path, [])
+        self.out = open(self.path, 'ab')
+        self.manifest = open(self.manifest_path, 'ab')
+
+    def recover(self):
+        for book_id, (count, stamp) in read_manifest(
+                self.manifest_path).iteritems():
+            if stamp == self.stamp:
+                self.done[book_id] = count
+        kept = list()
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as fh:
+                for line in fh:
+                    if line.endswith("\n") and \
+                            line.split("\t", 1)[0] in self.done:
+                        kept.append(line)
+        rewrite(self.path, kept)
+        rewrite(self.manifest_path,
+                ["%s\t%d\t%s\n" % (book_id, count, self.stamp)
+                    for book_id, count in self.done.iteritems()])
+
+    def write_book(self, book_id, sentences):
+        for sentence in sentences:
+            self.out.write(
+                    (str(book_id) + "\t" + sentence + "\n").encode('utf8'))
+        self.out.flush()
+        os.fsync(self.out.fileno())
+        self.manifest.write("%s\t%d\t%s\n" % (book_id, len(sentences),
+            self.stamp))
+        self.manifest.flush()
+        os.fsync(self.manifest.fileno())
+        self.done[str(book_id)] = len(sentences)
+
+    def close(self):
+        self.out.close()
+        self.manifest.close()
+
+def main(nlp, jobs=1, lexicon=None, output=None, resume=False,
+        cache_dir=None):
+    """prints book_id<tab>sentence for every nature sentence in the matching
+    books, in metadata order. with more than one job, books are processed
+    in a pool of worker processes (each loading its own copy of spacy, so
+    nlp isn't used); output is in the same order either way. if output is
+    given, sentences are written to that file (see Checkpoint) instead of
+    stdout, and with resume, books that are already finished are skipped.
+    with cache_dir, books' parses are cached there (see book_sentences)."""
+    book_ids = matching_book_ids()
+    checkpoint = None
+    if output is not None:
+        checkpoint = Checkpoint(output, resume)
+        book_ids = [b for b in book_ids if str(b) not in checkpoint.done]
+        sys.stderr.write("%d books finished, %d to go\n" % (
+            len(checkpoint.done), len(book_ids)))
+    pool = None
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs, _init_worker, (lexicon, cache_dir))
+        results = pool.imap(_worker_book_sentences, book_ids)
+    else:
+        results = (safe_book_sentences(nlp, book_id, cache_dir)
+                for book_id in book_ids)
+    total_stats = extract.FilterStats()
+    try:
+        for book_id, sentences, error, stats in results:
+            sys.stderr.write("current book: " + str(book_id) + "\n")
+            total_stats.update(stats)
+            if error is not None:
+                sys.stderr.write(error + "\n")
+                continue
+            for sentence in sentences:
                 sys.stderr.write(sentence + "\n")
-                print str(book_id) + "\t" + sentence
-        except ValueError as e:
-            sys.stderr.write(str(e) + "\n")
-            continue
+                if checkpoint is None:
+                    print str(book_id) + "\t" + sentence
+            if checkpoint is not None:
+                checkpoint.write_book(book_id, sentences)
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        # if anything went wrong (or on ctrl-c), don't leave workers behind
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        if checkpoint is not None:
+            checkpoint.close()
+    sys.stderr.write(total_stats.report() + "\n")
 
 if __name__ == '__main__':
-    import os
-    from spacy.en import English
-    sys.stderr.write("initializing spacy...\n")
-    nlp = English(data_dir=os.environ.get('SPACY_DATA'))
-    sys.stderr.write("done.\n")
-    main(nlp)
+    import argparse
+    parser = argparse.ArgumentParser(
+            description="extract nature sentences from Project Gutenberg")
+    parser.add_argument('--jobs', type=int, default=1,
+            help="number of books to process at once, each in its own "
+            "process (default 1)")
+    parser.add_argument('--lexicon', default=None,
+            help="table of lemma categories built with lexicon.py "
+            "(default: look lemmas up in WordNet)")
+    parser.add_argument('--output', default=None,
+            help="write sentences to this file (and keep track of finished "
+            "books in OUTPUT.manifest) instead of stdout")
+    parser.add_argument('--resume', action='store_true',
+            help="with --output, skip books that are already finished")
+    parser.add_argument('--cache', default=None,
+            help="directory to keep every book's parse in, so that later "
+            "runs (e.g. after changing the filters in extract.py) only have "
+            "to filter")
+    args = parser.parse_args()
+    if args.resume and args.output is None:
+        parser.error("--resume needs --output")
+    if args.cache is not None and not(os.path.isdir(args.cache)):
+        os.makedirs(args.cache)
+    if args.lexicon is not None:
+        extract.use_lexicon(args.lexicon)
+    nlp = None
+    if args.jobs <= 1:
+        from spacy.en import English
+        sys.stderr.write("initializing spacy...\n")
+        nlp = English(data_dir=os.environ.get('SPACY_DATA'))
+        sys.stderr.write("done.\n")
+    main(nlp, args.jobs, args.lexicon, args.output, args.resume, args.cache)
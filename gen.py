@@ -1,22 +1,170 @@
 import random
 import re
 import datetime
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter
+from itertools import izip
 
-from pattern.en import wordnet
-from extract import get_nsubj, first_s, replace_span, nsubj_is_plural, \
+import numpy
+
+from extract import get_nsubj, replace_span, nsubj_is_plural, \
         clauses, prep_phrases, requires_past_tense_agreement, indefify, \
-        normalize, punctuate, depunct
-
-chapter_heading_synsets = [wordnet.Synset(u"natural object"),
-    wordnet.Synset(u"body of water"),
-    wordnet.Synset(u"geological formation"),
-    wordnet.Synset(u"location")]
-chapter_heading_hyponyms = reduce(list.__add__,
-        [ss.hyponyms(recursive=True) for ss in chapter_heading_synsets])
-chapter_heading_all_nouns = reduce(list.__add__,
-        [ss.synonyms for ss in chapter_heading_hyponyms])
-chapter_heading_nouns = ["the " + s for s in chapter_heading_all_nouns \
-        if s.islower()]
+        normalize, punctuate, depunct, parser_version
+
+chapter_heading_synsets = [u"natural object", u"body of water",
+        u"geological formation", u"location"]
+# where chapter_heading_nouns caches its nouns (see use_heading_nouns_cache);
+# load_or_build_sentence_db keeps them next to the sentence database
+heading_nouns_cache = None
+
+def use_heading_nouns_cache(path):
+    "cache the chapter heading nouns in path"
+    global heading_nouns_cache
+    heading_nouns_cache = path
+
+def wordnet_version():
+    """version of pattern (and the WordNet it ships), for stamping the
+    heading nouns cache. only worked out when the nouns are looked up, since
+    importing pkg_resources is slow."""
+    import pkg_resources
+    return u"pattern-" + pkg_resources.get_distribution('pattern').version
+
+def heading_nouns_key():
+    return u"|".join(chapter_heading_synsets)
+
+def wordnet_heading_nouns():
+    "'the x' for every lowercase noun x under chapter_heading_synsets"
+    from pattern.en import wordnet
+    hyponyms = reduce(list.__add__,
+            [wordnet.Synset(name).hyponyms(recursive=True)
+                for name in chapter_heading_synsets])
+    all_nouns = reduce(list.__add__, [ss.synonyms for ss in hyponyms])
+    return sorted(set(["the " + s for s in all_nouns if s.islower()]))
+
+def read_heading_nouns(path, key):
+    """(version, nouns) cached in path, or None if there aren't any, they
+    were cached under a different key, or their header has no version stamp
+    (see wordnet_version)"""
+    try:
+        with open(path, 'rb') as fh:
+            lines = fh.read().decode('utf8').split(u"\n")
+    except IOError:
+        return None
+    version, _, cached_key = lines[0].partition(u":")
+    nouns = lines[1:]
+    if cached_key != key or not(version.startswith(u"pattern-")) or \
+            len(version) == len(u"pattern-") or not(any(nouns)):
+        return None
+    return version, nouns
+
+# the nouns from chapter_heading_nouns, and the version of pattern they came
+# from
+_chapter_heading_nouns = None
+_heading_nouns_version = None
+def chapter_heading_nouns(path=None):
+    """noun phrases to use as chapter headings, from wordnet_heading_nouns.
+    walking WordNet for them is slow, so they're cached in path (default
+    heading_nouns_cache; not cached if that's None), one per line after a
+    header line stamping them with the version of pattern and naming the
+    synsets they came from, and only looked up again if the cache is
+    missing, is for other synsets or has no stamp. (the cache isn't checked
+    against the installed pattern; delete it to look the nouns up again
+    after upgrading.)"""
+    global _chapter_heading_nouns, _heading_nouns_version
+    if _chapter_heading_nouns is not None:
+        return _chapter_heading_nouns
+    if path is None:
+        path = heading_nouns_cache
+    key = heading_nouns_key()
+    cached = read_heading_nouns(path, key) if path is not None else None
+    if cached is not None:
+        _heading_nouns_version, _chapter_heading_nouns = cached
+        return _chapter_heading_nouns
+    nouns = wordnet_heading_nouns()
+    version = wordnet_version()
+    if path is not None:
+        try:
+            tmp = path + ".tmp"
+            with open(tmp, 'wb') as fh:
+                fh.write(u"\n".join([version + u":" + key] +
+                    nouns).encode('utf8'))
+            os.rename(tmp, path)
+        except (IOError, OSError):
+            sys.stderr.write("couldn't cache heading nouns in %s\n" % path)
+    _heading_nouns_version, _chapter_heading_nouns = version, nouns
+    return nouns
+
+def heading_nouns_version():
+    "version stamp of chapter_heading_nouns (from its cache, if there is one)"
+    chapter_heading_nouns()
+    return _heading_nouns_version
+
+class GenerationStats(object):
+    """counts and timings from generation: calls to and time spent in each
+    realizer, how many times awareness had to look for a sentence whose
+    subject could be made indefinite, picks from each sentence database
+    bucket, the lengths of paragraphs (in sentences) and chapters (in
+    paragraphs), and time spent surfacing and rendering. only gathered when
+    turned on with enable_stats, since it costs a bit of time."""
+    def __init__(self):
+        self.calls = Counter()
+        self.seconds = Counter()
+        self.awareness_retries = Counter()
+        self.bucket_picks = Counter()
+        self.paragraph_lengths = Counter()
+        self.chapter_lengths = Counter()
+
+    def update(self, other):
+        "add in the stats from other (e.g. from a worker process)"
+        for name in ('calls', 'seconds', 'awareness_retries', 'bucket_picks',
+                'paragraph_lengths', 'chapter_lengths'):
+            getattr(self, name).update(getattr(other, name))
+
+    def report(self):
+        "the stats, as a dict that can be saved as JSON"
+        timings = dict()
+        for name, calls in self.calls.iteritems():
+            timings[name] = {'calls': calls,
+                    'seconds': self.seconds[name],
+                    'mean_ms': self.seconds[name] * 1000 / calls}
+        return {
+            'realizers': dict((name, t) for name, t in timings.iteritems()
+                if name in realizers),
+            'phases': dict((name, t) for name, t in timings.iteritems()
+                if name not in realizers),
+            'awareness_retries': {
+                'total': sum(n * count for n, count
+                    in self.awareness_retries.iteritems()),
+                'histogram': dict(self.awareness_retries)},
+            'bucket_picks': dict(self.bucket_picks),
+            'paragraph_lengths': dict(self.paragraph_lengths),
+            'chapter_lengths': dict(self.chapter_lengths),
+        }
+
+    def write(self, path):
+        with open(path, 'w') as fh:
+            json.dump(self.report(), fh, indent=2, sort_keys=True)
+
+# the GenerationStats being gathered, if any
+stats = None
+def enable_stats():
+    "start gathering GenerationStats (in the global stats), and return them"
+    global stats
+    stats = GenerationStats()
+    return stats
+
+def timed(name, fn, *args):
+    "fn(*args), adding the time it takes to stats.seconds[name]"
+    start = time.time()
+    result = fn(*args)
+    stats.calls[name] += 1
+    stats.seconds[name] += time.time() - start
+    return result
 
 class Sentence(object):
     """class for "flattened" sentences (i.e., spacy spans that have been
@@ -26,13 +174,62 @@ class Sentence(object):
         self.text = text
         self.nsubj = nsubj
 
-def sentence_db(nlp, fh):
+class TokenRecord(object):
+    """the handful of attributes of a spacy token (the root of a noun
+    phrase) that the generator actually looks at."""
+    __slots__ = ('orth_', 'tag_')
+    def __init__(self, orth_, tag_):
+        self.orth_ = orth_
+        self.tag_ = tag_
+
+class SpanRecord(object):
+    """stand-in for a spacy span in the sentence database: a range of
+    characters in the text of a database entry, plus (for subject noun
+    phrases) a TokenRecord for the root of the span. unlike a spacy span,
+    it doesn't keep the parsed document alive."""
+    __slots__ = ('source', 'start', 'end', 'root')
+    def __init__(self, source, start, end, root=None):
+        self.source = source
+        self.start = start
+        self.end = end
+        self.root = root
+    @property
+    def text(self):
+        return self.source[self.start:self.end]
+    orth_ = text
+
+def sentence_db(nlp, fh, batch_size=1000, workers=1):
+    """parse the tab-separated (source id, sentence) lines in fh into a
+    SentenceDB. lines are parsed in batches of batch_size; with more than one
+    worker, batches are parsed in a pool of processes (each with its own
+    copy of spacy), in which case nlp isn't used and can be None."""
+    lines = [line.decode('utf8').strip() for line in fh.readlines()]
+    return SentenceDB(parse_entries(nlp, lines, batch_size, workers))
+
+def parse_entries(nlp, lines, batch_size=1000, workers=1):
+    """sentence database entries for lines (as for sentence_db): one for
+    each line, followed by one for each clause of the lines that have
+    more than one."""
+    if workers > 1:
+        parsed = parse_lines_parallel(lines, batch_size, workers)
+    else:
+        parsed = parse_lines(nlp, lines, batch_size)
     sentences = list()
     clause_list = list()
-    for line in fh.readlines():
-        line = line.decode('utf8').strip()
-        src, text = line.split("\t")
-        span_obj = first_s(nlp, text)
+    for row, clause_rows in parsed:
+        sentences.append(entry_from_row(row))
+        clause_list.extend([entry_from_row(c) for c in clause_rows])
+    return sentences + clause_list
+
+def parse_lines(nlp, lines, batch_size=1000):
+    """yields a sentence database row (see compile_entry) for each line,
+    along with a list of rows for the line's clauses (if it has more than
+    one). nothing from the parse outlives the row, so each document can be
+    freed as soon as its line is done."""
+    pairs = [line.split("\t") for line in lines]
+    docs = nlp.pipe([text for src, text in pairs], batch_size=batch_size)
+    for (src, text), doc in izip(pairs, docs):
+        span_obj = next(doc.sents)
         ccs = clauses(span_obj)
         pps = prep_phrases(span_obj.root)
         agree = requires_past_tense_agreement(span_obj)
@@ -43,93 +240,290 @@ def sentence_db(nlp, fh):
         except ValueError:
             nsubj = None
             plural = None
-        sentences.append({
-            'src': int(src),
-            'text': text,
-            'span': span_obj,
-            'nsubj': nsubj,
-            'agree': agree,
-            'plural': plural,
-            'pps': pps,
-            })
+        row = compile_entry(int(src), text, span_obj, nsubj, agree, plural,
+                pps)
+        clause_rows = list()
         if len(ccs) > 1:
-            clause_list.extend([(src, span_obj, c) for c in ccs])
-    for src, span_obj, clause in clause_list:
-        pps = prep_phrases(clause.root)
-        agree = requires_past_tense_agreement(clause)
-        try:
-            nsubj = get_nsubj(clause)
-            plural = nsubj_is_plural(nsubj)
-        except ValueError:
-            continue
-        sentences.append({
-            'src': int(src),
-            'text': clause.text,
-            'span': clause,
-            'nsubj': nsubj,
-            'agree': agree,
+            for clause in ccs:
+                agree = requires_past_tense_agreement(clause)
+                try:
+                    nsubj = get_nsubj(clause)
+                    plural = nsubj_is_plural(nsubj)
+                except ValueError:
+                    continue
+                clause_rows.append(compile_entry(int(src), clause.text,
+                    clause, nsubj, agree, plural, []))
+        yield row, clause_rows
+
+_worker_nlp = None
+def _init_parse_worker():
+    global _worker_nlp
+    from spacy.en import English
+    _worker_nlp = English(data_dir=os.environ.get('SPACY_DATA'))
+
+def _parse_batch(lines):
+    return list(parse_lines(_worker_nlp, lines, len(lines)))
+
+def parse_lines_parallel(lines, batch_size=1000, workers=2):
+    """same as parse_lines, but parses batches of lines in a pool of worker
+    processes. results come back in the same order as the lines."""
+    batches = [lines[i:i+batch_size] for i in range(0, len(lines), batch_size)]
+    pool = multiprocessing.Pool(workers, _init_parse_worker)
+    try:
+        for batch in pool.imap(_parse_batch, batches):
+            for parsed in batch:
+                yield parsed
+    finally:
+        pool.terminate()
+
+def indef_or_none(nsubj):
+    "indefinite version of subject noun phrase, if there is one"
+    if nsubj is None:
+        return None
+    try:
+        return indefify(nsubj)
+    except IndexError:
+        return None
+
+def compile_entry(src, text, span, nsubj, agree, plural, pps):
+    """flatten a sentence database entry into a "row": a tuple of strings,
+    ints and bools. spacy spans become (start, end) character offsets into
+    the entry's text; the subject also keeps the orth and tag of its
+    root, along with its indefinite form (see indefify)."""
+    # the entry's text starts at its span's first token (the whole line for
+    # sentences, the clause itself for clauses)
+    base = span[0].idx
+    def extent(sp):
+        start = sp[0].idx - base
+        return (start, start + len(sp.text))
+    nsubj_row = None
+    if nsubj is not None:
+        nsubj_row = extent(nsubj) + (nsubj.root.orth_, nsubj.root.tag_)
+    return (src, text, extent(span), nsubj_row, agree, plural,
+            [extent(pp) for pp in pps], indef_or_none(nsubj))
+
+# tags come from a small set, so share one copy of each between records
+_tags = dict()
+
+def entry_from_row(row):
+    "turn a row from compile_entry into a sentence database entry"
+    src, text, span, nsubj, agree, plural, pps, indef = row
+    if nsubj is not None:
+        tag = _tags.setdefault(nsubj[3], nsubj[3])
+        nsubj = SpanRecord(text, nsubj[0], nsubj[1],
+                TokenRecord(nsubj[2], tag))
+    return {
+        'src': src,
+        'text': text,
+        'span': SpanRecord(text, *span),
+        'nsubj': nsubj,
+        'agree': agree,
+        'plural': plural,
+        'pps': [SpanRecord(text, *pp) for pp in pps],
+        'indef': indef,
+        }
+
+def corpus_digest(fname):
+    "a hash of the contents of the corpus file fname"
+    digest = hashlib.sha1()
+    with open(fname, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), ''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def line_hash(line):
+    """64-bit hash of a (stripped, unicode) line of a corpus file. a sentence
+    database keeps the hashes of the lines it was made from, so that it can
+    tell which lines of a corpus it already has."""
+    return int(hashlib.sha1(line.encode('utf8')).hexdigest()[:16], 16)
+
+def corpus_lines(fname):
+    with open(fname) as fh:
+        return [line.decode('utf8').strip() for line in fh]
+
+def store_key(key):
+    # the chapter headings are saved along with the database, so it's out of
+    # date if they would be different
+    return key + ":" + heading_nouns_version() + ":" + heading_nouns_key()
+
+def save_sentence_db(sdb, path, key, line_hashes=(), digest=None):
+    """write the sentence database to path, as a memory-mapped store (see
+    sentencestore.py), along with the hashes of the lines it came from and
+    the digest of the corpus file"""
+    import sentencestore
+    sentencestore.write(path, store_key(key), sdb, line_hashes, digest)
+
+def load_sentence_db(path, key):
+    """open a sentence database saved with save_sentence_db, as a
+    sentencestore.SentenceStore. returns None if there's no such file, or if
+    it was saved with a different key (e.g. with a different parser)."""
+    import sentencestore
+    return sentencestore.load(path, store_key(key))
+
+def append_sentence_db(sdb, path, nlp, lines, batch_size=1000, workers=1,
+        digest=None, hashes=None):
+    """add the corpus lines that aren't already in sdb (a SentenceStore, by
+    line_hash) to the store at path that it was opened from, parsing only
+    those lines (see parse_entries, for nlp, batch_size and workers; if nlp
+    is None, spacy is loaded only if there turn out to be new lines). the
+    entries already in the store are copied as they are. hashes are the
+    line_hashes of lines, if they've already been worked out. returns the
+    number of lines added."""
+    import sentencestore
+    if hashes is None:
+        hashes = [line_hash(line) for line in lines]
+    known = set(sdb.line_hashes.tolist())
+    new_lines = list()
+    new_hashes = list()
+    for line, h in izip(lines, hashes):
+        if h not in known:
+            known.add(h)
+            new_lines.append(line)
+            new_hashes.append(h)
+    entries = list()
+    if len(new_lines) > 0:
+        if nlp is None:
+            nlp = sentence_parser(workers)
+        entries = parse_entries(nlp, new_lines, batch_size, workers)
+    sentencestore.append(sdb, path, entries, heading_nps(entries),
+            new_hashes, digest)
+    return len(new_lines)
+
+def sentence_parser(jobs=1):
+    """spacy, for parsing sentence files in this process, or None if they're
+    going to be parsed in jobs worker processes"""
+    if jobs > 1:
+        return None
+    from spacy.en import English
+    sys.stderr.write("initializing spacy...")
+    nlp = English(data_dir=os.environ.get('SPACY_DATA'))
+    sys.stderr.write("done.\n")
+    return nlp
+
+def load_or_build_sentence_db(fname, batch_size=1000, jobs=1):
+    """the sentence database for the sentence file fname, opened from
+    fname + ".sdb". if that's out of date because lines have been added to
+    fname, only the new lines are parsed and added to it (see
+    append_sentence_db); otherwise (e.g. if lines have been removed, or it
+    was made with a different version of spacy) it's made again from
+    scratch (see sentence_db)."""
+    path = fname + ".sdb"
+    if heading_nouns_cache is None:
+        use_heading_nouns_cache(path + ".headings")
+    key = parser_version()
+    digest = corpus_digest(fname)
+    sdb = load_sentence_db(path, key)
+    if sdb is not None and sdb.digest == digest:
+        return sdb
+    lines = corpus_lines(fname)
+    hashes = [line_hash(line) for line in lines]
+    if sdb is not None and numpy.in1d(sdb.line_hashes,
+            numpy.array(hashes, dtype=numpy.uint64)).all():
+        added = append_sentence_db(sdb, path, None, lines, batch_size, jobs,
+                digest, hashes)
+        sys.stderr.write("added %d new lines to %s\n" % (added, path))
+    else:
+        sdb = SentenceDB(parse_entries(sentence_parser(jobs), lines,
+            batch_size, jobs))
+        save_sentence_db(sdb, path, key, hashes, digest)
+    return load_sentence_db(path, key)
+
+def heading_nps(entries):
+    "subjects of entries that are short enough to be chapter headings"
+    return [x['nsubj'].text for x in entries
+            if x['nsubj'] is not None and len(x['nsubj'].text) < 30]
+
+class SentenceDB(object):
+    """the sentence database: a list of sentence dicts (as built by
+    sentence_db), along with "buckets" of entries that are built once up
+    front, so that the generator functions can pick at random without
+    scanning the whole database every time. (a saved database is opened as
+    a sentencestore.SentenceStore, which works the same way.)"""
+    def __init__(self, sentences):
+        self.sentences = sentences
+        self.index()
+
+    def index(self):
+        with_subj = [x for x in self.sentences if x['nsubj'] is not None]
+        singular = [x for x in with_subj if not(x['plural'])]
+        plural = [x for x in with_subj if x['plural']]
+        agree_sg = [x for x in singular if x['agree']]
+        agree_pl = [x for x in plural if x['agree']]
+        no_agree = [x for x in with_subj if not(x['agree'])]
+        nps = [x['nsubj'] for x in with_subj]
+        self.buckets = {
+            'with_subj': with_subj,
+            'singular': singular,
             'plural': plural,
-            'pps': [],
-            })
-    return sentences
+            'agree_sg': agree_sg,
+            'agree_pl': agree_pl,
+            'no_agree': no_agree,
+            # sentences whose subject can be replaced by a singular or
+            # plural noun phrase, respectively
+            'for_singular': no_agree + agree_sg,
+            'for_plural': no_agree + agree_pl,
+            'no_subj': [x for x in self.sentences if x['nsubj'] is None],
+            'pps': [pp for x in self.sentences for pp in x['pps']],
+            'nps': nps,
+            'headings': list(set(heading_nps(self.sentences) +
+                chapter_heading_nouns())),
+        }
 
-def random_sentences(sdb):
-    qualified_sg = [x for x in sdb \
-            if x['nsubj'] is not None and x['plural'] is False]
-    qualified_pl = [x for x in sdb \
-            if x['nsubj'] is not None and x['plural'] is True]
-    no_nsubjs = [x for x in sdb if x['nsubj'] is None]
-    all_pps = reduce(
-            list.__add__, [x['pps'] for x in sdb if len(x['pps']) > 0])
-    while True:
-        choice = random.randrange(10)
-        if choice == 0:
-            no_nsubj = random.choice(no_nsubjs)
-            yield Sentence(text=no_nsubj['text'], nsubj=None)
+    def choice(self, bucket, rng=random):
+        if stats is not None:
+            stats.bucket_picks[bucket] += 1
+        return rng.choice(self.buckets[bucket])
+
+    def __len__(self):
+        return len(self.sentences)
+
+    def __iter__(self):
+        return iter(self.sentences)
+
+def random_sentence(sdb, rng=random):
+    choice = rng.randrange(10)
+    if choice == 0:
+        no_nsubj = sdb.choice('no_subj', rng)
+        return Sentence(text=no_nsubj['text'], nsubj=None)
+    else:
+        c, d = random_sentences_match_agreement(sdb, rng)
+        if len(c['pps']) > 0 and rng.randrange(2) == 0:
+            stext = replace_span(c['span'], rng.choice(c['pps']),
+                    ""+sdb.choice('pps', rng).text+"")
+            return Sentence(text=stext, nsubj=c['nsubj'])
         else:
-            c, d = random_sentences_match_agreement(sdb)
-            if len(c['pps']) > 0 and random.randrange(2) == 0:
-                stext = replace_span(c['span'], random.choice(c['pps']),
-                        ""+random.choice(all_pps).text+"")
-                yield Sentence(text=stext, nsubj=c['nsubj'])
-            else:
-                stext = replace_span(c['span'], c['nsubj'], d['nsubj'].text)
-                yield Sentence(text=stext, nsubj=d['nsubj'])
-
-def random_sentences_match_agreement(sdb):
-    sentences_with_subj = [x for x in sdb if x['nsubj'] is not None]
-    agree_sg = [x for x in sdb if x['nsubj'] is not None and (not(x['plural']))]
-    agree_pl = [x for x in sdb if x['nsubj'] is not None and x['plural']]
-    c = random.choice(sentences_with_subj)
+            stext = replace_span(c['span'], c['nsubj'], d['nsubj'].text)
+            return Sentence(text=stext, nsubj=d['nsubj'])
+
+def random_sentences(sdb, rng=random):
+    while True:
+        yield random_sentence(sdb, rng)
+
+def random_sentences_match_agreement(sdb, rng=random):
+    c = sdb.choice('with_subj', rng)
     if c['agree'] and c['plural']:
-        d = random.choice(agree_pl)
+        d = sdb.choice('plural', rng)
     elif c['agree'] and not(c['plural']):
-        d = random.choice(agree_sg)
+        d = sdb.choice('singular', rng)
     else:
-        d = random.choice(sentences_with_subj)
+        d = sdb.choice('with_subj', rng)
     return c, d
 
-def random_sentence_for_nsubj(sdb, nsubj):
-    no_agreement_sentences = [x for x in sdb if x['nsubj'] is not None \
-            and not(x['agree'])]
-    agree_sg = [x for x in sdb if x['nsubj'] is not None and \
-            (not(x['plural']) and x['agree'])]
-    agree_pl = [x for x in sdb if x['nsubj'] is not None and \
-            (x['plural'] and x['agree'])]
+def random_sentence_for_nsubj(sdb, nsubj, rng=random):
     if nsubj is not None:
         if nsubj_is_plural(nsubj):
-            d = random.choice(no_agreement_sentences + agree_pl)
+            d = sdb.choice('for_plural', rng)
             pronoun = "they"
         else:
-            d = random.choice(no_agreement_sentences + agree_sg)
+            d = sdb.choice('for_singular', rng)
             pronoun = "it"
     else:
-        d = random.choice(no_agreement_sentences + agree_sg)
+        d = sdb.choice('for_singular', rng)
         pronoun = "it"
     return pronoun, d
 
 def exposition(sdb, state):
-    sentence = random_sentences(sdb).next()
+    sentence = random_sentence(sdb, state.rng)
     if sentence.nsubj is not None:
         state.topics.append(sentence.nsubj)
         state.subj_orth.append(sentence.nsubj.orth_)
@@ -142,24 +536,23 @@ def awareness(sdb, state):
     adverbs = ["suddenly", "all at once", "gradually", "soon", "later", "then",
             "nearby", "in the distance", "meanwhile", "once in a while",
             "over and over", "again", "somewhere", "finally", "intermittently"]
-    qualified = [x for x in sdb if x['nsubj'] is not None]
+    retries = 0
     while True:
-        c = random.choice(qualified)
-        try:
-            np = indefify(c['nsubj'])
+        c = sdb.choice('with_subj', state.rng)
+        if c['indef'] is not None:
+            np = c['indef']
             break
-        except IndexError:
-            continue
-    intro = random.choice(verbs)
+        retries += 1
+    if stats is not None:
+        stats.awareness_retries[retries] += 1
+    intro = state.rng.choice(verbs)
     state.topics.append(c['nsubj'])
-    s = random.choice(["you", "I", "we"]) + " " + intro + " " + np
+    s = state.rng.choice(["you", "I", "we"]) + " " + intro + " " + np
     if len(state.paragraphs) > 0 and len(state.topics) > 0 and \
-            random.randrange(3) == 0:
-        s = random.choice(adverbs) + " " + s
-    if random.randrange(3) == 0:
-        all_pps = reduce(
-                list.__add__, [x['pps'] for x in sdb if len(x['pps']) > 0])
-        s += " " + random.choice(all_pps).text
+            state.rng.randrange(3) == 0:
+        s = state.rng.choice(adverbs) + " " + s
+    if state.rng.randrange(3) == 0:
+        s += " " + sdb.choice('pps', state.rng).text
     return s
 
 def elaborate_on_topic(sdb, state):
@@ -167,7 +560,7 @@ def elaborate_on_topic(sdb, state):
         prev = state.topics[-1]
     else:
         prev = None
-    subj, d = random_sentence_for_nsubj(sdb, prev)
+    subj, d = random_sentence_for_nsubj(sdb, prev, state.rng)
     if prev is not None and len(state.subj_orth) > 0 \
             and state.subj_orth[-1].lower() in ('it', 'they'):
         subj = "the " + prev.root.orth_
@@ -191,10 +584,9 @@ def reminded(sdb, state):
             and state.topics[-1] is not None:
         subj = "the " + state.topics[-1].root.orth_
     state.subj_orth.append(subj)
-    nps = [x['nsubj'] for x in sdb if x['nsubj'] is not None]
-    s = subj + " " + random.choice(verbs) + " " + random.choice(nps).text
-    if random.randrange(6) == 0:
-        s = random.choice(adverbs) + " " + s
+    s = subj + " " + state.rng.choice(verbs) + " " + sdb.choice('nps', state.rng).text
+    if state.rng.randrange(6) == 0:
+        s = state.rng.choice(adverbs) + " " + s
     return s
 
 def motion(sdb, state):
@@ -205,20 +597,20 @@ def motion(sdb, state):
     modals = ["decided to", "resolved to", "agreed to", "elected to"]
     adverbs = ["reluctantly", "discreetly", "foolishly", "regretfully",
         "at last", "finally", "hastily"]
-    s = ' '.join(["we", random.choice(modals), random.choice(verbs)])
-    if random.randrange(3) == 0:
-        s = random.choice(adverbs) + " " + s
+    s = ' '.join(["we", state.rng.choice(modals), state.rng.choice(verbs)])
+    if state.rng.randrange(3) == 0:
+        s = state.rng.choice(adverbs) + " " + s
     return s
 
 def affection(sdb, state):
-    return random.choice(["we embraced", "we smiled", "we held hands"])
+    return state.rng.choice(["we embraced", "we smiled", "we held hands"])
 
 def arrived(sdb, state):
-    s = random.choice(["we were home", "we had come home",
+    s = state.rng.choice(["we were home", "we had come home",
         "we had arrived"])
     adverbs = ["finally", "at last"]
-    if random.randrange(3) == 0:
-        s = random.choice(adverbs) + " " + s
+    if state.rng.randrange(3) == 0:
+        s = state.rng.choice(adverbs) + " " + s
     return s
 
 
@@ -240,17 +632,141 @@ paragraph_model = {
     arrived: [exposition, exposition, awareness, awareness, end_para]
 }
 
+positional_states = ('start', 'end-chapter', 'end-novel')
+
+# sentence types by name, for models loaded from JSON
+realizers = dict((f.__name__, f) for f in [exposition, awareness,
+    elaborate_on_topic, reminded, motion, affection, arrived, end_para])
+
+class ParagraphModel(object):
+    """a paragraph model (like paragraph_model) compiled into a table of
+    transition probabilities, so that the sentence types for a whole batch
+    of paragraphs can be sampled at once. the states are the positional
+    states ('start', 'end-chapter', 'end-novel') and the sentence types;
+    each state's transitions are weighted by how many times each sentence
+    type appears in its list, or can be given as a dict of sentence type ->
+    weight. sentence types can be realizer functions or their names."""
+    def __init__(self, model):
+        transitions = dict()
+        for state, targets in model.items():
+            if isinstance(targets, dict):
+                weighted = targets.items()
+            else:
+                weighted = [(t, 1) for t in targets]
+            transitions[state_name(state)] = [(state_name(t), float(w))
+                    for t, w in weighted]
+        for state in positional_states:
+            if state not in transitions:
+                raise ValueError("model has no %r state" % state)
+        for state, weighted in transitions.items():
+            if state not in realizers and state not in positional_states:
+                raise ValueError("unknown state %r" % state)
+            for t, w in weighted:
+                if t not in realizers:
+                    raise ValueError("unknown sentence type %r in %r" % (
+                        t, state))
+        self.states = sorted(set(transitions) | set(['end_para']) |
+                set(t for weighted in transitions.values()
+                    for t, w in weighted))
+        self.index = dict((s, i) for i, s in enumerate(self.states))
+        self.end = self.index['end_para']
+        self.realizers = [realizers.get(s) for s in self.states]
+        weights = numpy.zeros((len(self.states), len(self.states)))
+        for state, weighted in transitions.items():
+            for t, w in weighted:
+                weights[self.index[state], self.index[t]] += w
+        # cumulative probabilities; a uniform draw picks the first column
+        # whose value is greater than it
+        self.cumulative = numpy.ones(weights.shape)
+        for i, state in enumerate(self.states):
+            if i == self.end:
+                continue
+            nonzero = numpy.flatnonzero(weights[i] > 0)
+            if len(nonzero) == 0:
+                raise ValueError("no sentence types follow %r" % state)
+            self.cumulative[i] = numpy.cumsum(weights[i]) / weights[i].sum()
+            self.cumulative[i, nonzero[-1]:] = 1.0
+
+    def can_start(self, state):
+        "whether a paragraph can be sampled starting from state"
+        return state in self.index and self.index[state] != self.end
+
+    @classmethod
+    def load(cls, path):
+        """a model from a JSON file: an object shaped like paragraph_model,
+        with the names of sentence types in place of the functions."""
+        with open(path) as fh:
+            return cls(json.load(fh))
+
+    def sample(self, starts, rs):
+        """samples the sentence types of a batch of paragraphs, one for each
+        positional state in starts, using the numpy RandomState rs. returns
+        a list of realizer functions for each paragraph. every paragraph that
+        hasn't ended yet takes its next step at the same time."""
+        current = numpy.array([self.index[s] for s in starts], dtype=int)
+        sequences = [list() for s in starts]
+        active = numpy.arange(len(starts))
+        while len(active) > 0:
+            draws = rs.random_sample(len(active))
+            picks = (self.cumulative[current[active]] <=
+                    draws[:, numpy.newaxis]).sum(axis=1)
+            current[active] = picks
+            for i, pick in izip(active, picks):
+                if pick != self.end:
+                    sequences[i].append(self.realizers[pick])
+            active = active[picks != self.end]
+        return sequences
+
+def state_name(state):
+    if hasattr(state, '__call__'):
+        return state.__name__
+    return state
+
+compiled_model = None
+def use_model(model):
+    """generate paragraphs with model (a dict like paragraph_model, or the
+    path of a JSON file with one in it; see ParagraphModel) instead of
+    paragraph_model."""
+    global compiled_model
+    if isinstance(model, basestring):
+        compiled_model = ParagraphModel.load(model)
+    else:
+        compiled_model = ParagraphModel(model)
+
+def current_model():
+    global compiled_model
+    if compiled_model is None:
+        compiled_model = ParagraphModel(paragraph_model)
+    return compiled_model
+
+def random_date(rng=random):
+    return datetime.date(
+            rng.randrange(1950, 2050),
+            rng.randrange(1, 13),
+            rng.randrange(1, 28))
+
+def date_step(rng=random):
+    "days between one chapter and the next"
+    return datetime.timedelta(days=rng.choice([1,1,1,1,2,2,3,4,5]))
+
 class NovelState(object):
-    def __init__(self, chapters=None, i=0, chapter_count=0):
+    """rng is the source of every random choice made while generating (the
+    random module itself unless it's given a random.Random). the novel
+    starts on start_date (drawn from rng if it isn't given), and the
+    current chapter is on current_date (default start_date)."""
+    def __init__(self, chapters=None, i=0, chapter_count=0, rng=random,
+            start_date=None, current_date=None):
         if chapters is None:
             self.chapters = []
         else:
             self.chapters = chapters
-        self.current_date = datetime.date(
-                random.randrange(1950, 2050),
-                random.randrange(1, 13),
-                random.randrange(1, 28))
-        self.start_date = self.current_date
+        self.rng = rng
+        if start_date is None:
+            start_date = random_date(rng)
+        self.start_date = start_date
+        if current_date is None:
+            current_date = start_date
+        self.current_date = current_date
         self.chapter_count = chapter_count
         self.i = i
 
@@ -260,6 +776,7 @@ class ChapterState(object):
         self.history = []
         self.subj_orth = []
         self.novel = novel
+        self.rng = novel.rng
         self.paragraph_count = paragraph_count
         self.i = i
         if paragraphs is None:
@@ -273,56 +790,62 @@ class ChapterState(object):
 class EndParagraph(Exception):
     pass
 
-def chapter_heading(sdb):
-    nps = [x['nsubj'].text for x in sdb if x['nsubj'] is not None \
-            and len(x['nsubj'].text) < 30]
-    headings = list(set(nps + chapter_heading_nouns))
-    return random.choice(headings)
+def chapter_heading(sdb, rng=random):
+    return sdb.choice('headings', rng)
 
 def chapter(sdb, state):
     "a chapter consists of a series of paragraphs."
-    heading = normalize(chapter_heading(sdb))
-    if random.randrange(3) == 0:
+    heading = normalize(chapter_heading(sdb, state.rng))
+    if state.rng.randrange(3) == 0:
         dds = str(int(state.current_date.strftime("%d")))
         heading += ". " + state.current_date.strftime("%A, %B ") + dds
-    if random.randrange(2) == 0:
+    if state.rng.randrange(2) == 0:
         delta = state.current_date - state.start_date
         delta_dds = delta.days + 1
         heading += " (Day %d)" % delta_dds
     paragraphs = list()
-    paragraph_count = random.choice([1,2,2,2,3,3,3,3,3,4,4,4,4,5,5,5,6,7,8])
-    for i in range(paragraph_count):
+    paragraph_count = state.rng.choice([1,2,2,2,3,3,3,3,3,4,4,4,4,5,5,5,6,7,8])
+    # special positional rules: the last paragraph of a chapter (or of the
+    # novel) starts differently
+    if state.i == state.chapter_count - 1:
+        last = 'end-novel'
+    else:
+        last = 'end-chapter'
+    starts = ['start'] * (paragraph_count - 1) + [last]
+    rs = numpy.random.RandomState(state.rng.getrandbits(32))
+    sequences = current_model().sample(starts, rs)
+    for i, sequence in enumerate(sequences):
         st = ChapterState(paragraphs=paragraphs, novel=state,
                 paragraph_count=paragraph_count, i=i)
-        new_p = paragraph(sdb, st)
+        new_p = paragraph(sdb, st, sequence)
         paragraphs.append(new_p)
+    if stats is not None:
+        stats.chapter_lengths[len(paragraphs)] += 1
     return heading, paragraphs
 
-def paragraph(sdb, state):
+def paragraph(sdb, state, sequence):
     """a paragraph consists of a series of sentences. the nature of each
-    sentence follows the "sentence model" for the novel"""
+    sentence follows the "sentence model" for the novel; sequence is the
+    list of sentence types sampled from it for this paragraph (see
+    ParagraphModel.sample)."""
     sentences = list()
-    while True:
-        try:
-            # special positional rules
-            if len(state.history) == 0:
-                if state.i == state.paragraph_count - 1:
-                    if state.novel.i == state.novel.chapter_count - 1:
-                        current = 'end-novel'
-                    else:
-                        current = 'end-chapter'
-                else:
-                    current = 'start'
-            else:
-                current = state.history[-1]
-            pick = random.choice(paragraph_model[current])
+    for pick in sequence:
+        if stats is None:
             sentences.append((pick, pick(sdb, state)))
-            state.history.append(pick)
-        except EndParagraph:
-            return sentences
+        else:
+            sentences.append((pick, timed(pick.__name__, pick, sdb, state)))
+        state.history.append(pick)
+    if stats is not None:
+        stats.paragraph_lengths[len(sentences)] += 1
+    return sentences
 
-def surface(chapter):
+def surface(chapter, rng=random):
     "turn a chapter into surface text."
+    if stats is not None:
+        return timed('surface', surface_chapter, chapter, rng)
+    return surface_chapter(chapter, rng)
+
+def surface_chapter(chapter, rng=random):
     title = chapter[0]
     paragraph_src = chapter[1]
     paragraphs = list()
@@ -340,8 +863,8 @@ def surface(chapter):
             if i < len(para)-1 and len(sentence) < 60 and len(next_s) < 60 and \
                     not(re.search(r"\b(and|but)\b", sentence+next_s)) and \
                     para_i != len(paragraph_src)-1 and \
-                    random.randrange(2) == 0:
-                if random.randrange(4) == 0:
+                    rng.randrange(2) == 0:
+                if rng.randrange(4) == 0:
                     conj = "; "
                 else:
                     conj = " and "
@@ -356,65 +879,280 @@ def surface(chapter):
     return title, paragraphs
 
 def novel(sdb, chapter_count=100):
+    "generates chapters, one at a time"
     state = NovelState(chapter_count=chapter_count)
-    chapters = list()
     for i in range(chapter_count):
         state.i = i
-        chapters.append(chapter(sdb, state))
-        state.current_date += datetime.timedelta(
-                days=random.choice([1,1,1,1,2,2,3,4,5]))
-    return chapters
+        yield chapter(sdb, state)
+        state.current_date += date_step(state.rng)
+
+def chapter_seed(seed, i):
+    "seed for chapter i's random.Random, derived from the novel's seed"
+    return int(hashlib.sha1("%s:%d" % (seed, i)).hexdigest()[:16], 16)
+
+def chapter_dates(seed, chapter_count):
+    """(start date, date of each chapter) for a seeded novel, drawn from their
+    own random.Random so that they don't depend on the chapters. (it's
+    seeded like a chapter that doesn't exist: random.Random would hash a
+    string seed, and string hashes differ between builds and with -R.)"""
+    rng = random.Random(chapter_seed(seed, -1))
+    start = random_date(rng)
+    dates = [start]
+    while len(dates) < chapter_count:
+        dates.append(dates[-1] + date_step(rng))
+    return start, dates
+
+def seeded_chapter(sdb, seed, i, chapter_count, start_date, current_date):
+    """generates and surfaces chapter i of a seeded novel. everything random
+    about the chapter comes from a random.Random seeded with
+    chapter_seed(seed, i), so it doesn't matter which chapters were generated
+    before it, or in which process."""
+    rng = random.Random(chapter_seed(seed, i))
+    state = NovelState(chapter_count=chapter_count, i=i, rng=rng,
+            start_date=start_date, current_date=current_date)
+    return surface(chapter(sdb, state), rng)
+
+def seeded_chapter_jobs(seed, chapter_count):
+    "arguments to seeded_chapter (after sdb) for each chapter of a novel"
+    start, dates = chapter_dates(seed, chapter_count)
+    return [(seed, i, chapter_count, start, date)
+            for i, date in enumerate(dates)]
+
+def seeded_paragraph(sdb, seed, start='start'):
+    """a single surfaced paragraph (a list of sentences), starting from the
+    paragraph model state start, seeded like the first chapter of a novel
+    with the same seed."""
+    rng = random.Random(chapter_seed(seed, 0))
+    start_date, dates = chapter_dates(seed, 1)
+    state = ChapterState(NovelState(chapter_count=1, rng=rng,
+        start_date=start_date), paragraph_count=1)
+    rs = numpy.random.RandomState(rng.getrandbits(32))
+    sequence = current_model().sample([start], rs)[0]
+    return surface((u"", [paragraph(sdb, state, sequence)]), rng)[1][0]
+
+_pool_sdb = None
+def _seeded_chapter(args):
+    """(chapter, stats gathered while generating it, or None if stats are
+    off) for seeded_chapter in a pool worker"""
+    global stats
+    if stats is None:
+        return seeded_chapter(_pool_sdb, *args), None
+    stats = GenerationStats()
+    return seeded_chapter(_pool_sdb, *args), stats
+
+def pooled_chapters(pool, jobs):
+    "chapters from a chapter_pool, merging the workers' stats into ours"
+    for ch, chapter_stats in pool.imap(_seeded_chapter, jobs):
+        if chapter_stats is not None and stats is not None:
+            stats.update(chapter_stats)
+        yield ch
+
+def chapter_pool(sdb, workers):
+    """a pool of processes for seeded_novel. they're forked after sdb is in
+    place, so they share it rather than each getting a copy."""
+    global _pool_sdb
+    _pool_sdb = sdb
+    return multiprocessing.Pool(workers)
 
-def render_latex_template(fh, chapters):
+def seeded_novel(sdb, chapter_count=100, seed=0, workers=1, pool=None):
+    """like novel(), but yields surfaced chapters (see surface), and always
+    generates the same ones for the same seed. with more than one worker (or
+    a pool from chapter_pool, which is left open for the next novel),
+    chapters are generated in a pool of processes; they're yielded in order,
+    and are identical to the ones generated with one worker."""
+    jobs = seeded_chapter_jobs(seed, chapter_count)
+    if pool is not None:
+        for ch in pooled_chapters(pool, jobs):
+            yield ch
+        return
+    if workers <= 1:
+        for job in jobs:
+            yield seeded_chapter(sdb, *job)
+        return
+    pool = chapter_pool(sdb, workers)
+    try:
+        for ch in pooled_chapters(pool, jobs):
+            yield ch
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
+
+def word_count(surfaced):
+    return sum(len(s.split()) for para in surfaced[1] for s in para)
+
+def novel_seed(seed, n):
+    "seed for the nth novel of a batch"
+    return "%s.%d" % (seed, n)
+
+def write_novels(sdb, template, count, chapter_count, out_dir, seed=None,
+        workers=1):
+    """writes count novels (filling in template, a LaTeX template as read
+    from template.tex) to out_dir, all from the same sdb, and a summary of
+    them to manifest.json there. each novel is seeded with novel_seed(seed,
+    n), so any of them can be made again with gen.py --seed; without a seed,
+    a random one is picked (and recorded in the manifest). returns the
+    manifest."""
+    import StringIO
+    if seed is None:
+        seed = "%x" % random.SystemRandom().getrandbits(64)
+    if not(os.path.isdir(out_dir)):
+        os.makedirs(out_dir)
+    manifest = {'seed': seed, 'chapters': chapter_count, 'novels': []}
+    pool = None
+    if workers > 1:
+        pool = chapter_pool(sdb, workers)
+    batch_start = time.time()
+    try:
+        for n in range(count):
+            fname = "novel-%04d.tex" % n
+            this_seed = novel_seed(seed, n)
+            words = [0]
+            def counted(chapters):
+                for ch in chapters:
+                    words[0] += word_count(ch)
+                    yield ch
+            start = time.time()
+            with open(os.path.join(out_dir, fname), 'wb') as out:
+                render_latex_template(StringIO.StringIO(template),
+                        counted(seeded_novel(sdb, chapter_count, this_seed,
+                            pool=pool)), out)
+            manifest['novels'].append({'file': fname, 'seed': this_seed,
+                'words': words[0], 'seconds': time.time() - start})
+            sys.stderr.write("%s: %d words\n" % (fname, words[0]))
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        if pool is not None:
+            pool.terminate()
+    manifest['seconds'] = time.time() - batch_start
+    manifest['words'] = sum(n['words'] for n in manifest['novels'])
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    return manifest
+
+def render_latex_template(fh, chapters, out):
+    """fills in the <<chapters>> placeholder in the template read from fh with
+    surfaced chapters (e.g., surface() of each chapter from novel(), or the
+    chapters from seeded_novel()), writing utf8 to out. each chapter is
+    written as soon as it has been generated, so nothing holds on to the
+    whole book. a template without the placeholder is written unchanged."""
     tmpl = fh.read().decode('utf8')
-    tmpl_s = tmpl.replace("<<chapters>>",
-            '\n'.join([to_latex(surface(ch)) for ch in chapters]))
-    return tmpl_s
+    if "<<chapters>>" not in tmpl:
+        out.write(tmpl.encode('utf8'))
+        return
+    head, tail = tmpl.split("<<chapters>>", 1)
+    out.write(head.encode('utf8'))
+    out.flush()
+    for i, ch in enumerate(chapters):
+        if i > 0:
+            out.write("\n")
+        if stats is None:
+            out.write(to_latex(ch).encode('utf8'))
+        else:
+            out.write(timed('render', to_latex, ch).encode('utf8'))
+        out.flush()
+    out.write(tail.encode('utf8'))
 
 # from http://stackoverflow.com/a/25875504 ugh
+tex_escapes = {
+    '&': r'\&',
+    '%': r'\%',
+    '$': r'\$',
+    '#': r'\#',
+    '_': r'\_',
+    '{': r'\{',
+    '}': r'\}',
+    '~': r'\textasciitilde{}',
+    '^': r'\^{}',
+    '\\': r'\textbackslash{}',
+    '<': r'\textless',
+    '>': r'\textgreater',
+}
+# every key is a single character, so unicode text can be escaped with
+# unicode.translate; the regular expression is for byte strings
+tex_escape_table = dict((ord(key), unicode(value))
+        for key, value in tex_escapes.iteritems())
+tex_escape_re = re.compile('|'.join(re.escape(unicode(key))
+        for key in tex_escapes))
+
 def tex_escape(text):
     """
         :param text: a plain text message
         :return: the message escaped to appear correctly in LaTeX
     """
-    conv = {
-        '&': r'\&',
-        '%': r'\%',
-        '$': r'\$',
-        '#': r'\#',
-        '_': r'\_',
-        '{': r'\{',
-        '}': r'\}',
-        '~': r'\textasciitilde{}',
-        '^': r'\^{}',
-        '\\': r'\textbackslash{}',
-        '<': r'\textless',
-        '>': r'\textgreater',
-    }
-    regex = re.compile('|'.join(re.escape(unicode(key)) \
-        for key in sorted(conv.keys(), key = lambda item: - len(item))))
-    return regex.sub(lambda match: conv[match.group()], text)
+    if isinstance(text, unicode):
+        return text.translate(tex_escape_table)
+    return tex_escape_re.sub(lambda match: tex_escapes[match.group()], text)
 
 def to_latex(surfaced):
-    doc = "\chapter{%s}\n\n" % surfaced[0]
+    doc = ["\chapter{%s}\n\n" % surfaced[0]]
     for para in surfaced[1]:
-        doc += tex_escape(' '.join(para)) + "\n\n"
-    return doc
+        doc.append(tex_escape(' '.join(para)) + "\n\n")
+    return ''.join(doc)
 
 def to_text(surfaced, *args, **kwargs):
     import textwrap
-    doc = surfaced[0] + "\n\n"
+    doc = [surfaced[0] + "\n\n"]
     for para in surfaced[1]:
-        doc += "\n".join(textwrap.wrap(' '.join(para))) + "\n\n"
-    return doc
+        doc.append("\n".join(textwrap.wrap(' '.join(para))) + "\n\n")
+    return ''.join(doc)
 
 if __name__ == '__main__':
-    import os, sys
-    from spacy.en import English
-    count, sentence_fname = sys.argv[1:]
-    sys.stderr.write("initializing spacy...")
-    nlp = English(data_dir=os.environ.get('SPACY_DATA'))
-    sys.stderr.write("done.\n")
-    sdb = sentence_db(nlp, open(sentence_fname))
-    print render_latex_template(sys.stdin, novel(sdb, int(count)))
-
+    import argparse
+    parser = argparse.ArgumentParser(
+            description="generate a novel from a database of sentences")
+    parser.add_argument('count', type=int, help="number of chapters")
+    parser.add_argument('sentence_fname',
+            help="file of tab-separated (source id, sentence) lines")
+    parser.add_argument('--batch-size', type=int, default=1000,
+            help="sentences per parser batch (default 1000)")
+    parser.add_argument('--jobs', type=int, default=1,
+            help="processes to use when building the database and (with "
+            "--seed) when generating chapters")
+    parser.add_argument('--model', default=None,
+            help="JSON file with a paragraph model to use instead of the "
+            "built-in one")
+    parser.add_argument('--seed', default=None,
+            help="generate the same novel every time for this seed, "
+            "however many --jobs there are")
+    parser.add_argument('--batch', type=int, default=None, metavar='N',
+            help="write N novels to --out-dir instead of one to stdout")
+    parser.add_argument('--out-dir', default='novels',
+            help="directory for --batch novels and their manifest.json "
+            "(default novels)")
+    parser.add_argument('--heading-cache', default=None, metavar='FILE',
+            help="where to cache the WordNet nouns used for chapter "
+            "headings (default: next to the sentence database)")
+    parser.add_argument('--stats', default=None, metavar='FILE',
+            help="gather timings and counts while generating, and save "
+            "them to FILE as JSON at the end (or whenever the process gets "
+            "SIGUSR1)")
+    args = parser.parse_args()
+    if args.model is not None:
+        use_model(args.model)
+    if args.heading_cache is not None:
+        use_heading_nouns_cache(args.heading_cache)
+    if args.stats is not None:
+        import signal
+        enable_stats()
+        signal.signal(signal.SIGUSR1,
+                lambda signum, frame: stats.write(args.stats))
+    sdb = load_or_build_sentence_db(args.sentence_fname, args.batch_size,
+            args.jobs)
+    if args.batch is not None:
+        manifest = write_novels(sdb, sys.stdin.read(), args.batch,
+                args.count, args.out_dir, args.seed, args.jobs)
+        sys.stderr.write("%d novels, %d words in %.1fs\n" % (
+            len(manifest['novels']), manifest['words'],
+            manifest['seconds']))
+    elif args.seed is None:
+        render_latex_template(sys.stdin,
+                (surface(ch) for ch in novel(sdb, args.count)), sys.stdout)
+    else:
+        render_latex_template(sys.stdin,
+                seeded_novel(sdb, args.count, args.seed, args.jobs),
+                sys.stdout)
+    if args.stats is not None:
+        stats.write(args.stats)
@@ -0,0 +1,356 @@
+"""keeps a sentence database in memory and serves generated text over HTTP,
+on a local TCP port or a unix socket, so that other programs can ask for
+text without paying to load the database every time.
+
+    $ python genserver.py nature_sentences.txt --port 8000 --jobs 4
+    $ curl 'localhost:8000/chapters?count=3&seed=42'
+
+requests:
+
+    GET /chapters?count=N    N chapters (default 1), as from gen.seeded_novel
+    GET /novel?chapters=N    a whole novel of N chapters (default 100); with
+                             format=latex, filled into the template
+    GET /paragraph?state=X   one paragraph, starting from paragraph model
+                             state X (default start)
+    POST /reload             load the sentence file again (e.g. after it has
+                             changed), in the background, without dropping
+                             requests; 202 if it started, 409 if a reload is
+                             already going
+    GET /metrics             request counts and latencies, as JSON
+
+the generating requests take seed= (a random one is picked if it's missing;
+either way, it's sent back in the X-Seed header) and format= (text, latex or
+json; default text). generation happens in a fixed-size pool of worker
+processes that share the database, so a burst of requests waits its turn
+instead of swamping the machine."""
+
+import BaseHTTPServer
+import SocketServer
+import StringIO
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import traceback
+import urlparse
+from collections import Counter, deque
+
+import gen
+
+class BadRequest(Exception):
+    status = 400
+
+class Conflict(BadRequest):
+    status = 409
+
+def _seeded_paragraph(args):
+    return gen.seeded_paragraph(gen._pool_sdb, *args)
+
+class Generator(object):
+    """the sentence database for the sentence file fname, and a pool of jobs
+    worker processes that share it."""
+    def __init__(self, fname, jobs=2, batch_size=1000, template=None):
+        self.fname = fname
+        self.jobs = max(jobs, 1)
+        self.batch_size = batch_size
+        self.template = template
+        self.lock = threading.Lock()
+        self.sdb = None
+        self.pool = None
+        self.reloading = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """loads the sentence file (parsing it again if it has changed) and
+        starts a new pool with it. the old pool finishes whatever it was
+        already given before it goes away. returns the number of sentences
+        now loaded."""
+        sdb = gen.load_or_build_sentence_db(self.fname, self.batch_size,
+                self.jobs)
+        with self.lock:
+            old = self.pool
+            self.sdb = sdb
+            # forks while no handler is using a pool (see start_reload)
+            self.pool = gen.chapter_pool(sdb, self.jobs)
+        if old is not None:
+            old.close()
+            threading.Thread(target=old.join).start()
+        return len(sdb)
+
+    def start_reload(self):
+        """reloads on a thread of its own, so that a request doesn't wait
+        for the sentence file to be parsed. only one reload happens at a
+        time: returns False (and does nothing) if one is already going.
+
+        both parsing (with jobs > 1) and starting the new pool fork worker
+        processes from that thread while handler threads keep running, and a
+        forked child only gets the forking thread, along with whatever locks
+        the other threads held at the time. the pool is started holding
+        self.lock, so no handler is handing work to a pool then; the workers
+        don't touch anything else the handlers lock."""
+        if not(self.reloading.acquire(False)):
+            return False
+        def reload():
+            try:
+                count = self.reload()
+                sys.stderr.write("reloaded %d sentences\n" % count)
+            except Exception:
+                sys.stderr.write(traceback.format_exc())
+            finally:
+                self.reloading.release()
+        thread = threading.Thread(target=reload)
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def chapters(self, count, seed):
+        "count surfaced chapters, seeded like gen.seeded_novel"
+        jobs = gen.seeded_chapter_jobs(seed, count)
+        with self.lock:
+            result = self.pool.map_async(gen._seeded_chapter, jobs)
+        return [ch for ch, chapter_stats in result.get()]
+
+    def paragraph(self, state, seed):
+        "a surfaced paragraph, as from gen.seeded_paragraph"
+        if not(gen.current_model().can_start(state)):
+            raise BadRequest("no paragraph can start from state: " + state)
+        with self.lock:
+            result = self.pool.apply_async(_seeded_paragraph, ((seed, state),))
+        return result.get()
+
+    def close(self):
+        with self.lock:
+            self.pool.close()
+            self.pool.join()
+
+class Metrics(object):
+    """request counts, errors and latencies by path. latencies are kept for
+    the last window requests to each path."""
+    def __init__(self, window=1000):
+        self.window = window
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.errors = Counter()
+        self.latencies = dict()
+
+    def record(self, path, seconds, error=False):
+        with self.lock:
+            self.counts[path] += 1
+            if error:
+                self.errors[path] += 1
+            if path not in self.latencies:
+                self.latencies[path] = deque(maxlen=self.window)
+            self.latencies[path].append(seconds)
+
+    def report(self):
+        "dict of path -> counts and latency stats (in milliseconds)"
+        report = dict()
+        with self.lock:
+            for path, latencies in self.latencies.iteritems():
+                ms = sorted(l * 1000 for l in latencies)
+                report[path] = {
+                    'count': self.counts[path],
+                    'errors': self.errors[path],
+                    'mean_ms': sum(ms) / len(ms),
+                    'p50_ms': ms[len(ms) // 2],
+                    'p95_ms': ms[min(len(ms) - 1, int(len(ms) * 0.95))],
+                    'max_ms': ms[-1]
+                }
+        return report
+
+def int_param(params, name, default, low=1, high=10000):
+    try:
+        value = int(params.get(name, default))
+    except ValueError:
+        raise BadRequest(name + " must be a number")
+    if not(low <= value <= high):
+        raise BadRequest("%s must be between %d and %d" % (name, low, high))
+    return value
+
+# seeds are sent back in a header, so they're kept to characters that are
+# safe there
+valid_seed = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+def seed_param(params):
+    if 'seed' in params:
+        if not(valid_seed.match(params['seed'])):
+            raise BadRequest("seed must be 1 to 64 letters, digits, "
+                    "'_', '.' or '-'")
+        return params['seed']
+    return "%x" % random.SystemRandom().getrandbits(64)
+
+def format_param(params):
+    fmt = params.get('format', 'text')
+    if fmt not in ('text', 'latex', 'json'):
+        raise BadRequest("format must be text, latex or json")
+    return fmt
+
+def render_chapters(chapters, fmt, seed, template=None):
+    "(content type, body) for a list of surfaced chapters"
+    if fmt == 'json':
+        return 'application/json', json.dumps({'seed': seed,
+            'chapters': [{'title': title, 'paragraphs': paragraphs}
+                for title, paragraphs in chapters]})
+    if fmt == 'latex':
+        if template is not None:
+            out = StringIO.StringIO()
+            gen.render_latex_template(StringIO.StringIO(template), chapters,
+                    out)
+            return 'application/x-latex', out.getvalue()
+        return 'application/x-latex', \
+                "\n".join(gen.to_latex(ch) for ch in chapters).encode('utf8')
+    return 'text/plain; charset=utf-8', \
+            "".join(gen.to_text(ch) for ch in chapters).encode('utf8')
+
+def chapters_request(generator, metrics, params):
+    seed = seed_param(params)
+    fmt = format_param(params)
+    chapters = generator.chapters(int_param(params, 'count', 1), seed)
+    return seed, render_chapters(chapters, fmt, seed)
+
+def novel_request(generator, metrics, params):
+    seed = seed_param(params)
+    fmt = format_param(params)
+    chapters = generator.chapters(int_param(params, 'chapters', 100), seed)
+    return seed, render_chapters(chapters, fmt, seed, generator.template)
+
+def paragraph_request(generator, metrics, params):
+    seed = seed_param(params)
+    fmt = format_param(params)
+    state = params.get('state', 'start')
+    sentences = generator.paragraph(state, seed)
+    if fmt == 'json':
+        return seed, ('application/json', json.dumps({'seed': seed,
+            'state': state, 'sentences': sentences}))
+    text = ' '.join(sentences)
+    if fmt == 'latex':
+        return seed, ('application/x-latex',
+                (gen.tex_escape(text) + "\n").encode('utf8'))
+    return seed, ('text/plain; charset=utf-8', (text + "\n").encode('utf8'))
+
+def reload_request(generator, metrics, params):
+    if not(generator.start_reload()):
+        raise Conflict("already reloading")
+    return None, ('application/json', json.dumps({'reloading': True}), 202)
+
+def metrics_request(generator, metrics, params):
+    return None, ('application/json', json.dumps(metrics.report()))
+
+routes = {
+    ('GET', '/chapters'): chapters_request,
+    ('GET', '/novel'): novel_request,
+    ('GET', '/paragraph'): paragraph_request,
+    ('POST', '/reload'): reload_request,
+    ('GET', '/metrics'): metrics_request
+}
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def dispatch(self, method):
+        url = urlparse.urlparse(self.path)
+        route = routes.get((method, url.path))
+        if route is None:
+            self.respond(404, 'text/plain', "not found\n")
+            return
+        start = time.time()
+        seed = None
+        try:
+            params = dict(urlparse.parse_qsl(url.query))
+            seed, response = route(self.server.generator,
+                    self.server.metrics, params)
+            # a route can give a status after the body (default 200)
+            ctype, body, status = (response + (200,))[:3]
+        except BadRequest as e:
+            status, ctype, body = e.status, 'text/plain', str(e) + "\n"
+        except Exception:
+            # the details are for the log, not the client
+            sys.stderr.write(traceback.format_exc())
+            status, ctype, body = 500, 'text/plain', "internal error\n"
+        self.server.metrics.record(url.path, time.time() - start,
+                status >= 400)
+        self.respond(status, ctype, body, seed)
+
+    def respond(self, status, ctype, body, seed=None):
+        self.send_response(status)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        if seed is not None:
+            self.send_header('X-Seed', seed)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # unix socket clients don't have an address
+        client = self.client_address[0] if self.client_address else 'local'
+        sys.stderr.write("%s - - [%s] %s\n" % (client,
+            self.log_date_time_string(), format % args))
+
+class HTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+class UnixHTTPServer(SocketServer.ThreadingMixIn,
+        SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+def make_server(generator, port=8000, host='127.0.0.1', socket_path=None):
+    """an HTTP server for generator, listening on socket_path (a unix
+    socket) if it's given, otherwise on host:port."""
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, Handler)
+    else:
+        server = HTTPServer((host, port), Handler)
+    server.generator = generator
+    server.metrics = Metrics()
+    return server
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+            description="serve generated text from a database of sentences")
+    parser.add_argument('sentence_fname',
+            help="file of tab-separated (source id, sentence) lines")
+    parser.add_argument('--port', type=int, default=8000,
+            help="port to listen on (default 8000)")
+    parser.add_argument('--host', default='127.0.0.1',
+            help="address to listen on (default 127.0.0.1)")
+    parser.add_argument('--socket', default=None,
+            help="listen on this unix socket instead of a port")
+    parser.add_argument('--jobs', type=int, default=2,
+            help="worker processes for generation (default 2)")
+    parser.add_argument('--batch-size', type=int, default=1000,
+            help="sentences per parser batch, if the database needs to be "
+            "built (default 1000)")
+    parser.add_argument('--model', default=None,
+            help="JSON file with a paragraph model to use instead of the "
+            "built-in one")
+    parser.add_argument('--template', default='template.tex',
+            help="LaTeX template for whole novels (default template.tex)")
+    args = parser.parse_args()
+    if args.model is not None:
+        gen.use_model(args.model)
+    template = None
+    if os.path.exists(args.template):
+        with open(args.template) as fh:
+            template = fh.read()
+    generator = Generator(args.sentence_fname, args.jobs, args.batch_size,
+            template)
+    server = make_server(generator, args.port, args.host, args.socket)
+    sys.stderr.write("listening on %s\n" % (
+        args.socket or "%s:%d" % (args.host, args.port)))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        generator.close()
@@ -1,7 +1,11 @@
+import itertools
 import json
+import marshal
+import re
 import zipfile
 import os
 import zipfile
+from contextlib import closing
 
 records = None
 def load_data(fh=None):
@@ -28,8 +32,134 @@ def pluck(exprs, rec):
             results.append(rec[item])
     return results
 
-def get_iso_text(gutenberg_id, iso_path="/Volumes/PGDVD_2010_04_RC2"):
-    import re, glob
+def tokens(s):
+    "normalized tokens for indexing subjects and titles"
+    return re.findall(r'\w+', s.lower(), re.U)
+
+class MetadataIndex(object):
+    """an index over the metadata file, so that searches don't need to parse
+    every record. maps each distinct subject identifier, subject token and
+    title token to the gutenberg ids of the books that have it; records
+    themselves stay in the metadata file, and are read (from their byte
+    offsets) only when asked for."""
+    def __init__(self, data_path, stamp, offsets, subjects, subject_tokens,
+            title_tokens):
+        self.data_path = data_path
+        self.stamp = stamp
+        self.offsets = offsets
+        self.subjects = subjects
+        self.subject_tokens = subject_tokens
+        self.title_tokens = title_tokens
+        self.data_fh = None
+
+    @classmethod
+    def build(cls, data_path):
+        offsets = dict()
+        subjects = dict()
+        subject_tokens = dict()
+        title_tokens = dict()
+        def add(index, key, gid):
+            ids = index.setdefault(key, [])
+            if len(ids) == 0 or ids[-1] != gid:
+                ids.append(gid)
+        with open(data_path, 'rb') as fh:
+            offset = 0
+            for line in iter(fh.readline, ''):
+                rec = json.loads(line)
+                gid = rec['gutenberg_id']
+                offsets[gid] = offset
+                offset += len(line)
+                for subj in rec['subjects']:
+                    add(subjects, subj['identifier'], gid)
+                    for tok in tokens(subj['identifier']):
+                        add(subject_tokens, tok, gid)
+                for tok in tokens(rec.get('title') or u''):
+                    add(title_tokens, tok, gid)
+        return cls(data_path, file_stamp(data_path), offsets, subjects,
+                subject_tokens, title_tokens)
+
+    def save(self, path):
+        with open(path, 'wb') as fh:
+            marshal.dump((self.stamp, self.offsets, self.subjects,
+                self.subject_tokens, self.title_tokens), fh)
+
+    @classmethod
+    def load(cls, path, data_path):
+        """loads an index saved at path, or returns None if it's missing or
+        out of date with respect to the metadata file."""
+        try:
+            with open(path, 'rb') as fh:
+                data = marshal.load(fh)
+        except (IOError, EOFError, ValueError):
+            return None
+        if data[0] != file_stamp(data_path):
+            return None
+        return cls(data_path, *data)
+
+    def in_file_order(self, ids):
+        return sorted(ids, key=self.offsets.__getitem__)
+
+    def record(self, gid):
+        "the full metadata record for gid"
+        if self.data_fh is None:
+            self.data_fh = open(self.data_path, 'rb')
+        self.data_fh.seek(self.offsets[gid])
+        return json.loads(self.data_fh.readline())
+
+    def subject_ids(self, pattern, flags=re.I):
+        """ids of books that have a subject identifier matching the regular
+        expression (with re.search). only the distinct identifiers are
+        searched, not every record."""
+        regex = re.compile(pattern, flags)
+        found = set()
+        for subj, ids in self.subjects.iteritems():
+            if regex.search(subj):
+                found.update(ids)
+        return self.in_file_order(found)
+
+    def token_ids(self, index, words):
+        found = None
+        for tok in tokens(words):
+            ids = set(index.get(tok, []))
+            found = ids if found is None else found & ids
+        return self.in_file_order(found or [])
+
+    def subject_token_ids(self, words):
+        "ids of books whose subjects contain all of the words"
+        return self.token_ids(self.subject_tokens, words)
+
+    def title_ids(self, words):
+        "ids of books whose titles contain all of the words"
+        return self.token_ids(self.title_tokens, words)
+
+def file_stamp(path):
+    st = os.stat(path)
+    return [st.st_size, int(st.st_mtime)]
+
+index = None
+def load_index(data_path='47000_metadata.json', index_path=None):
+    """returns the MetadataIndex for the metadata file, building it (and
+    saving it to index_path, by default next to the metadata file) the first
+    time, or whenever the metadata file changes."""
+    global index
+    if index is not None and index.data_path == data_path:
+        return index
+    if index_path is None:
+        index_path = os.path.splitext(data_path)[0] + '.idx'
+    index = MetadataIndex.load(index_path, data_path)
+    if index is None:
+        index = MetadataIndex.build(data_path)
+        index.save(index_path)
+    return index
+
+def search_subjects(pattern):
+    "records of books with a subject matching the regular expression"
+    idx = load_index()
+    return [idx.record(gid) for gid in idx.subject_ids(pattern)]
+
+def iso_member(gutenberg_id, iso_path="/Volumes/PGDVD_2010_04_RC2"):
+    "(zipfile, name of the text file in it) for a book on the ISO image"
+    import glob
     sid = str(gutenberg_id)
     path = '/'.join([iso_path] + list(sid[:-1]) + [sid])
     for fname in glob.glob(path + "/*.ZIP"):
@@ -37,16 +167,72 @@ def get_iso_text(gutenberg_id, iso_path="/Volumes/PGDVD_2010_04_RC2"):
         txtfiles = [f for f in zf.infolist() \
                 if re.search(r'\.txt$', f.filename, re.I)]
         if len(txtfiles) > 0:
-            return zf.read(txtfiles[0].filename).decode('latin1')
-    raise ValueError("couldn't fetch " + sid) 
+            return zf, txtfiles[0].filename
+        zf.close()
+    raise ValueError("couldn't fetch " + sid)
+
+def get_iso_text(gutenberg_id, iso_path="/Volumes/PGDVD_2010_04_RC2"):
+    zf, name = iso_member(gutenberg_id, iso_path)
+    with closing(zf):
+        return zf.read(name).decode('latin1')
+
+# Project Gutenberg's header ends with one of these...
+pg_start = re.compile(r'^\*+\s*START OF (THE|THIS) PROJECT GUTENBERG|'
+        r'^\*END\*THE SMALL PRINT', re.I)
+# ...and its license starts with one of these
+pg_end = re.compile(r'^\*+\s*END OF (THE|THIS) PROJECT GUTENBERG|'
+        r'^End of (the |this )?Project Gutenberg', re.I)
+
+def strip_boilerplate(lines, header_lines=600):
+    """drops the Project Gutenberg header and license from an iterable of
+    lines. if there's no start-of-text marker in the first header_lines
+    lines, nothing at the beginning is dropped."""
+    lines = iter(lines)
+    head = list()
+    for line in lines:
+        if pg_start.search(line):
+            head = list()
+            break
+        head.append(line)
+        if len(head) >= header_lines:
+            break
+    for line in itertools.chain(head, lines):
+        if pg_end.search(line):
+            return
+        yield line
+
+def paragraphs(lines, max_chars=20000):
+    """joins lines into paragraphs (separated by blank lines). paragraphs
+    longer than max_chars are broken up, so no chunk gets too big."""
+    para = list()
+    length = 0
+    for line in lines:
+        line = line.strip()
+        if len(line) > 0:
+            para.append(line)
+            length += len(line) + 1
+        if len(para) > 0 and (len(line) == 0 or length > max_chars):
+            yield ' '.join(para)
+            para = list()
+            length = 0
+    if len(para) > 0:
+        yield ' '.join(para)
+
+def iter_iso_text(gutenberg_id, iso_path="/Volumes/PGDVD_2010_04_RC2"):
+    """like get_iso_text, but reads the book from the zip file a bit at a
+    time, without the Project Gutenberg boilerplate, and yields it a
+    paragraph at a time."""
+    zf, name = iso_member(gutenberg_id, iso_path)
+    with closing(zf):
+        lines = (line.decode('latin1') for line in zf.open(name))
+        for para in paragraphs(strip_boilerplate(lines)):
+            yield para
 
 if __name__ == '__main__':
     import pprint
-    import re
 
     subjs = 'Western|Science fiction|Geology|Natural|Exploration|Discovery|Physical'
     books = [pluck(['gutenberg_id', 'title'], r) for r in \
-                search(lambda x: any([re.search(subjs, t['identifier'], re.I)
-                    for t in x['subjects']]))]
+                search_subjects(subjs)]
     print len(books)
     pprint.pprint(books)
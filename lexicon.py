@@ -0,0 +1,106 @@
+"""a precompiled table of WordNet noun lemmas and the categories they belong
+to (see extract.lemma_categories), so that extraction doesn't need to load
+WordNet or walk any hypernyms.
+
+the table is a single file that gets memory-mapped, so any number of
+processes using the same table share one copy of it. layout (all integers
+little-endian):
+
+    4 bytes   magic ("LEX1")
+    uint32    number of lemmas, n
+    uint32    n+1 offsets into the key blob (lemma i is blob[off[i]:off[i+1]])
+    uint8     n category masks
+    ...       key blob: utf8-encoded lemmas, sorted bytewise
+"""
+
+import mmap
+import os
+import struct
+
+MAGIC = 'LEX1'
+
+def lemma_key(lemma):
+    "the form that lemmas are stored in (and looked up by) in the table"
+    if isinstance(lemma, unicode):
+        lemma = lemma.encode('utf8')
+    return lemma.lower().replace('_', ' ')
+
+def wordnet_noun_lemmas(dict_dir=None):
+    """every lemma in WordNet's noun index (index.noun in the WordNet dict
+    directory; by default, the one that comes with pattern)."""
+    if dict_dir is None:
+        from pattern.en import wordnet
+        dict_dir = os.path.join(os.path.dirname(wordnet.__file__), 'dict')
+    with open(os.path.join(dict_dir, 'index.noun')) as fh:
+        for line in fh:
+            # the license at the top of the file is indented
+            if line.startswith(' '):
+                continue
+            yield line.split(' ', 1)[0]
+
+def build(path, dict_dir=None):
+    """classify every noun lemma in WordNet and write the results to a table
+    at path. returns the number of lemmas in the table."""
+    import extract
+    masks = dict()
+    for lemma in wordnet_noun_lemmas(dict_dir):
+        key = lemma_key(lemma)
+        if key not in masks:
+            masks[key] = extract.classify_lemma(key.decode('utf8'))
+    keys = sorted(masks.keys())
+    offsets = [0]
+    for key in keys:
+        offsets.append(offsets[-1] + len(key))
+    with open(path, 'wb') as fh:
+        fh.write(MAGIC)
+        fh.write(struct.pack('<I', len(keys)))
+        fh.write(struct.pack('<%dI' % len(offsets), *offsets))
+        fh.write(struct.pack('<%dB' % len(keys), *[masks[k] for k in keys]))
+        fh.write(''.join(keys))
+    return len(keys)
+
+class Lexicon(object):
+    "a memory-mapped table written by build()"
+    def __init__(self, path):
+        with open(path, 'rb') as fh:
+            self.mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:4] != MAGIC:
+            raise ValueError(path + " isn't a lemma table")
+        self.count = struct.unpack_from('<I', self.mm, 4)[0]
+        self.offsets_at = 8
+        self.masks_at = self.offsets_at + 4 * (self.count + 1)
+        self.blob_at = self.masks_at + self.count
+
+    def __len__(self):
+        return self.count
+
+    def key(self, i):
+        start, end = struct.unpack_from('<2I', self.mm, self.offsets_at + 4*i)
+        return self.mm[self.blob_at+start:self.blob_at+end]
+
+    def get(self, lemma):
+        """category mask for lemma. lemmas that aren't in the table aren't
+        WordNet nouns, so they don't belong to any category."""
+        key = lemma_key(lemma)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key = self.key(mid)
+            if mid_key < key:
+                lo = mid + 1
+            elif mid_key > key:
+                hi = mid
+            else:
+                return ord(self.mm[self.masks_at+mid])
+        return 0
+
+if __name__ == '__main__':
+    import argparse, sys
+    parser = argparse.ArgumentParser(
+            description="build a table of WordNet noun lemma categories")
+    parser.add_argument('output', help="file to write the table to")
+    parser.add_argument('--dict', dest='dict_dir', default=None,
+            help="WordNet dict directory (default: the one in pattern)")
+    args = parser.parse_args()
+    count = build(args.output, args.dict_dir)
+    sys.stderr.write("wrote %d lemmas to %s\n" % (count, args.output))
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+"""picks sentences out of the parse cache kept by extract_nature_sentences.py
+(see --cache there) with a query, instead of with filters written in python
+like the ones in extract.py. each clause of the query is compiled into a
+check over arrays of token attributes for all of a book's sentences at once.
+
+    $ python query.py parses/ "root tag VBD, all subject lemmas in category
+        natural, no PRP subject, length 20-140" >themed_sentences.txt
+
+prints book_id<tab>sentence for each sentence that matches every clause (in
+the same format as extract_nature_sentences.py), and then, on stderr, how
+many sentences each clause was given and how many it kept.
+
+clauses are separated by commas:
+
+    length A-B            the sentence is more than A and fewer than B
+                          characters long
+    root tag T            the sentence's root has tag T (also root dep D,
+                          root lemma L)
+    Q TOKENS [PREDICATE]  a quantity Q of the tokens TOKENS (that match
+                          PREDICATE, if it's given)
+
+where Q is one of
+
+    all                   there are some TOKENS, and they all match
+    any                   at least one of TOKENS matches
+    no                    none of TOKENS match
+    at least N / at most N
+
+TOKENS are words naming the tokens to look at: dependency labels (lowercase,
+e.g. nsubj, or "subject" for nsubj) and tags (uppercase, e.g. NN); a token
+has to have one of the labels and one of the tags, if any are given. "tokens"
+means all of them. PREDICATE is one of
+
+    in category C         the token's lemma is in category C (natural,
+                          person, physical object or geological formation;
+                          see extract.lemma_categories)
+    lemma L               the token's lemma is L
+    tag T                 the token's tag is T
+
+any of which can start with "not", and alternatives can be given with "|"
+anywhere a label, tag or lemma is expected (e.g. "no NN|NNS in category
+person"). "lemmas", "words" and "of" can be used anywhere to make a clause
+read better; they're ignored."""
+
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+import numpy
+
+import extract
+
+categories = {
+    'natural': extract.NATURAL,
+    'person': extract.PERSON,
+    'physical object': extract.PHYSICAL_OBJECT,
+    'geological formation': extract.GEOLOGICAL_FORMATION,
+}
+
+dep_synonyms = {'subject': 'nsubj', 'subjects': 'nsubj'}
+filler_words = ('lemmas', 'words', 'of')
+
+class ParsedSentences(object):
+    """the sentences in an iterable of parsed docs, as arrays: the lemma,
+    tag, dependency label and (absolute) head of every token, the index of
+    each sentence's first token, and the tag, dependency label and lemma of
+    each sentence's root. texts are the sentences' texts. the docs are
+    only looked at one at a time (so they can come straight from
+    read_parse_cache), but the arrays and texts for all of them are kept:
+    for a book, that's a few times the size of its text, much less than
+    its parse."""
+    def __init__(self, docs):
+        from spacy.attrs import LEMMA, TAG, DEP, HEAD
+        self.strings = None
+        arrays = list()
+        starts = list()
+        self.texts = list()
+        offset = 0
+        for doc in docs:
+            if len(doc) == 0:
+                continue
+            self.strings = doc.vocab.strings
+            arr = doc.to_array([LEMMA, TAG, DEP, HEAD]).astype(numpy.int64)
+            # heads are stored relative to each token
+            arr[:, 3] += numpy.arange(len(doc)) + offset
+            arrays.append(arr)
+            for sent in doc.sents:
+                starts.append(offset + sent.start)
+                self.texts.append(sent.text)
+            offset += len(doc)
+        if arrays:
+            tokens = numpy.concatenate(arrays)
+        else:
+            tokens = numpy.zeros((0, 4), dtype=numpy.int64)
+        self.lemmas, self.tags, self.deps, self.heads = tokens.T
+        self.starts = numpy.array(starts, dtype=numpy.int64)
+        lengths = numpy.diff(numpy.append(self.starts, offset))
+        self.sentence_of = numpy.repeat(numpy.arange(len(starts)), lengths)
+        roots = numpy.flatnonzero(self.heads == numpy.arange(offset))
+        self.root = numpy.zeros(len(starts), dtype=numpy.int64)
+        self.root[self.sentence_of[roots]] = roots
+
+    def __len__(self):
+        return len(self.starts)
+
+    def ids(self, values):
+        "the string ids of values (a list of strings)"
+        return [self.strings[unicode(value)] for value in values]
+
+    def per_sentence(self, mask):
+        "the number of tokens in each sentence for which mask is True"
+        return numpy.add.reduceat(mask.astype(numpy.int64), self.starts)
+
+    def lemma_categories(self, mask):
+        """the category mask (see extract.lemma_categories) of each token's
+        lemma; only looked up for the tokens where mask is True"""
+        result = numpy.zeros(len(self.lemmas), dtype=numpy.int64)
+        lemma_ids, index = numpy.unique(self.lemmas[mask],
+                return_inverse=True)
+        looked_up = numpy.array([extract.lemma_categories(self.strings[int(i)])
+            for i in lemma_ids], dtype=numpy.int64)
+        result[mask] = looked_up[index]
+        return result
+
+def alternatives(word):
+    return word.split('|')
+
+def compile_predicate(words):
+    """function of (ParsedSentences, token mask) -> token mask for a
+    predicate"""
+    negate = False
+    if words and words[0] == 'not':
+        negate = True
+        words = words[1:]
+    if len(words) < 2:
+        raise ValueError("incomplete predicate: " + ' '.join(words))
+    if words[0] == 'in' and words[1] == 'category':
+        name = ' '.join(words[2:]).replace('_', ' ')
+        if name not in categories:
+            raise ValueError("no such category: " + name)
+        category = categories[name]
+        def check(sents, mask):
+            return (sents.lemma_categories(mask) & category) != 0
+    elif words[0] in ('lemma', 'tag') and len(words) == 2:
+        attr = words[0] + 's'
+        values = alternatives(words[1])
+        def check(sents, mask):
+            return numpy.in1d(getattr(sents, attr), sents.ids(values))
+    else:
+        raise ValueError("unknown predicate: " + ' '.join(words))
+    if negate:
+        return lambda sents, mask: ~check(sents, mask)
+    return check
+
+def compile_tokens(words):
+    "function of ParsedSentences -> token mask for a list of TOKENS words"
+    deps = list()
+    tags = list()
+    for word in words:
+        if word == 'tokens':
+            continue
+        for value in alternatives(word):
+            value = dep_synonyms.get(value, value)
+            if value.islower():
+                deps.append(value)
+            else:
+                tags.append(value)
+    def select(sents):
+        mask = numpy.ones(len(sents.tags), dtype=bool)
+        if deps:
+            mask &= numpy.in1d(sents.deps, sents.ids(deps))
+        if tags:
+            mask &= numpy.in1d(sents.tags, sents.ids(tags))
+        return mask
+    return select
+
+quantifiers = {
+    'all': lambda selected, matching, n: (selected > 0) &
+        (matching == selected),
+    'any': lambda selected, matching, n: matching > 0,
+    'no': lambda selected, matching, n: matching == 0,
+    'at least': lambda selected, matching, n: matching >= n,
+    'at most': lambda selected, matching, n: matching <= n,
+}
+
+length_clause = re.compile(u'^length (\\d+) ?[-–] ?(\\d+)$')
+
+def compile_clause(clause):
+    """function of ParsedSentences -> boolean array (one per sentence) for
+    one clause of a query"""
+    match = length_clause.match(clause)
+    if match:
+        low, high = int(match.group(1)), int(match.group(2))
+        return lambda sents: numpy.array(
+                [low < len(text) < high for text in sents.texts], dtype=bool)
+    words = [w for w in clause.split() if w not in filler_words]
+    if len(words) == 3 and words[0] == 'root' and \
+            words[1] in ('tag', 'dep', 'lemma'):
+        attr = words[1] + 's'
+        values = alternatives(words[2])
+        return lambda sents: numpy.in1d(getattr(sents, attr)[sents.root],
+                sents.ids(values))
+    n = None
+    if words[:2] in (['at', 'least'], ['at', 'most']):
+        quantifier = ' '.join(words[:2])
+        try:
+            n = int(words[2])
+        except (IndexError, ValueError):
+            raise ValueError("'%s' needs a number: %s" % (quantifier, clause))
+        words = words[3:]
+    elif words and words[0] in quantifiers:
+        quantifier = words[0]
+        words = words[1:]
+    else:
+        raise ValueError("don't know what to do with: " + clause)
+    predicate_at = len(words)
+    for i, word in enumerate(words):
+        if word in ('in', 'not', 'lemma', 'tag'):
+            predicate_at = i
+            break
+    if predicate_at == 0:
+        raise ValueError("no tokens given: " + clause)
+    select = compile_tokens(words[:predicate_at])
+    predicate = None
+    if predicate_at < len(words):
+        predicate = compile_predicate(words[predicate_at:])
+    quantify = quantifiers[quantifier]
+    def check(sents):
+        selected = select(sents)
+        matching = selected
+        if predicate is not None:
+            matching = selected & predicate(sents, selected)
+        return quantify(sents.per_sentence(selected),
+                sents.per_sentence(matching), n)
+    return check
+
+def compile_query(query):
+    "list of (clause, function) pairs, one for each clause of the query"
+    clauses = [c.strip() for c in query.split(',') if c.strip()]
+    if not(clauses):
+        raise ValueError("empty query")
+    return [(clause, compile_clause(clause)) for clause in clauses]
+
+class QueryStats(object):
+    """how many sentences each clause of a query was given (i.e., were kept
+    by the clauses before it), how many it kept, and how long it took."""
+    def __init__(self, clauses):
+        self.clauses = [clause for clause, check in clauses]
+        self.books = 0
+        self.sentences = 0
+        self.given = Counter()
+        self.kept = Counter()
+        self.seconds = Counter()
+
+    def report(self):
+        lines = ["%d sentences in %d books" % (self.sentences, self.books)]
+        for clause in self.clauses:
+            given = self.given[clause]
+            lines.append("%s: kept %d of %d (%.1f%%, %.2fs)" % (clause,
+                self.kept[clause], given,
+                100.0 * self.kept[clause] / given if given else 0,
+                self.seconds[clause]))
+        return "\n".join(lines)
+
+def matching_sentences(clauses, sents, stats):
+    "the texts of the sentences in sents that match all of clauses"
+    keep = numpy.ones(len(sents), dtype=bool)
+    for clause, check in clauses:
+        start = time.time()
+        stats.given[clause] += int(keep.sum())
+        keep &= check(sents)
+        stats.kept[clause] += int(keep.sum())
+        stats.seconds[clause] += time.time() - start
+    return [sents.texts[i] for i in numpy.flatnonzero(keep)]
+
+def cached_book_ids(cache_dir):
+    "ids of the books in the parse cache in cache_dir, in order"
+    ids = [name[:-len(".docs")] for name in os.listdir(cache_dir)
+            if name.endswith(".docs")]
+    return sorted(ids, key=lambda book_id: (len(book_id), book_id))
+
+def run_query(nlp, query, cache_dir, book_ids=None, stats=None):
+    """yields (book id, sentence) for each sentence in the parse cache in
+    cache_dir (or in the books book_ids in it) that matches query. sentences
+    are normalized as extract.nature_sentences does."""
+    from extract_nature_sentences import read_parse_cache, parse_cache_path
+    clauses = compile_query(query)
+    if stats is None:
+        stats = QueryStats(clauses)
+    if book_ids is None:
+        book_ids = cached_book_ids(cache_dir)
+    for book_id in book_ids:
+        docs = read_parse_cache(nlp, parse_cache_path(cache_dir, book_id))
+        if docs is None:
+            sys.stderr.write("no parse cached for book %s\n" % book_id)
+            continue
+        sents = ParsedSentences(docs)
+        stats.books += 1
+        stats.sentences += len(sents)
+        if len(sents) == 0:
+            continue
+        for text in matching_sentences(clauses, sents, stats):
+            yield book_id, extract.ucfirst(extract.normalize(text))
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+            description="pick sentences out of a parse cache with a query")
+    parser.add_argument('cache_dir',
+            help="directory of parses (see extract_nature_sentences.py "
+            "--cache)")
+    parser.add_argument('query', help="comma-separated clauses")
+    parser.add_argument('--books', default=None,
+            help="comma-separated ids of the books to look at (default: "
+            "every book in the cache)")
+    parser.add_argument('--lexicon', default=None,
+            help="table of lemma categories built with lexicon.py "
+            "(default: look lemmas up in WordNet)")
+    args = parser.parse_args()
+    query = args.query.decode('utf8')
+    try:
+        clauses = compile_query(query)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.lexicon is not None:
+        extract.use_lexicon(args.lexicon)
+    book_ids = None
+    if args.books is not None:
+        book_ids = args.books.split(',')
+    from spacy.en import English
+    sys.stderr.write("initializing spacy...")
+    nlp = English(data_dir=os.environ.get('SPACY_DATA'))
+    sys.stderr.write("done.\n")
+    stats = QueryStats(clauses)
+    for book_id, sentence in run_query(nlp, query, args.cache_dir, book_ids,
+            stats):
+        print (book_id + "\t" + sentence).encode('utf8')
+    sys.stderr.write(stats.report() + "\n")
@@ -0,0 +1,361 @@
+"""the sentence database (see gen.SentenceDB) stored by column in a single
+file that gets memory-mapped, so that opening it takes no time at all, and
+any number of generator processes using the same database share one copy of
+it. entries, and the spans in them, are only made into python objects when
+they're picked.
+
+layout (all integers little-endian):
+
+    4 bytes   magic ("SDB3")
+    uint32    length of the header
+    ...       header: JSON object with the database's key, the digest of
+              the corpus file it was made from, the tags that subjects'
+              roots can have, and the offset (from the start of the column
+              data), dtype and shape of each column
+    ...       column data, each column starting on an 8-byte boundary
+
+columns, for n entries with m prepositional phrases between them (character
+offsets are into the entry's own text; byte offsets are into the blob):
+
+    text      n+1 byte offsets (entry i's text is blob[text[i]:text[i+1]])
+    src       n source ids
+    span      n (start, end) character offsets of the entry's span
+    flags     n bit masks (see HAS_SUBJ etc.)
+    nsubj     n (start, end) character offsets of the subject
+    tag       n indexes into the header's tags of the subject's root's tag
+    orth      n (start, end) byte offsets of the subject's root's orth
+    indef     n (start, end) byte offsets of the subject's indefinite form
+    pp_index  n+1 offsets into pps (entry i's are pps[pp_index[i]:...[i+1]])
+    pps       m (start, end) character offsets
+    pp_entry  m indexes of the entry that each prepositional phrase is in
+    headings  h (start, end) byte offsets of the chapter headings
+    bucket_*  indexes of the entries in each bucket of entries
+    line_hashes
+              sorted hashes of the corpus lines that the entries came from
+    blob      utf8-encoded text: the entries' texts (in order), then the
+              other strings
+"""
+
+import json
+import mmap
+import os
+import random
+import struct
+
+import numpy
+
+import gen
+
+MAGIC = 'SDB3'
+
+HAS_SUBJ = 1
+AGREE = 2
+PLURAL = 4
+HAS_INDEF = 8
+
+# buckets of entries, as in SentenceDB.index. the rest ('pps', 'nps' and
+# 'headings') are worked out from other columns.
+entry_buckets = ['with_subj', 'singular', 'plural', 'agree_sg', 'agree_pl',
+        'no_agree', 'for_singular', 'for_plural', 'no_subj']
+
+def entry_bucket_indexes(flags):
+    "the indexes of the entries in each of entry_buckets, given their flags"
+    def where(mask):
+        return numpy.flatnonzero(mask).astype(numpy.int32)
+    with_subj = (flags & HAS_SUBJ) != 0
+    agree = (flags & AGREE) != 0
+    plural = (flags & PLURAL) != 0
+    no_agree = where(with_subj & ~agree)
+    agree_sg = where(with_subj & ~plural & agree)
+    agree_pl = where(with_subj & plural & agree)
+    return {
+        'with_subj': where(with_subj),
+        'singular': where(with_subj & ~plural),
+        'plural': where(with_subj & plural),
+        'agree_sg': agree_sg,
+        'agree_pl': agree_pl,
+        'no_agree': no_agree,
+        'for_singular': numpy.concatenate([no_agree, agree_sg]),
+        'for_plural': numpy.concatenate([no_agree, agree_pl]),
+        'no_subj': where(~with_subj),
+    }
+
+def entry_columns(entries, headings, tags):
+    """the columns for entries and headings (all but the buckets and
+    line_hashes), as a dict of name -> array. tags is the list of subjects'
+    root tags that the tag column indexes, which new tags are added to."""
+    # entries' texts go at the start of the blob, one after another; the
+    # rest of the strings go after them
+    texts = list()
+    strings = list()
+    strings_size = [0]
+    def add(s):
+        """add s to the blob (after the texts), returning its (start, end)
+        byte offsets from the end of the texts"""
+        data = s.encode('utf8')
+        strings.append(data)
+        start = strings_size[0]
+        strings_size[0] += len(data)
+        return start, strings_size[0]
+    text, src, span, flags, nsubj, tag, orth, indef, pp_index, pps = \
+            [list() for i in range(10)]
+    text.append(0)
+    pp_index.append(0)
+    for entry in entries:
+        texts.append(entry['text'].encode('utf8'))
+        text.append(text[-1] + len(texts[-1]))
+        src.append(entry['src'])
+        span.append((entry['span'].start, entry['span'].end))
+        mask = 0
+        if entry['agree']:
+            mask |= AGREE
+        subj = entry['nsubj']
+        if subj is not None:
+            mask |= HAS_SUBJ
+            if entry['plural']:
+                mask |= PLURAL
+            if subj.root.tag_ not in tags:
+                tags.append(subj.root.tag_)
+            nsubj.append((subj.start, subj.end))
+            tag.append(tags.index(subj.root.tag_))
+            orth.append(add(subj.root.orth_))
+        else:
+            nsubj.append((0, 0))
+            tag.append(0)
+            orth.append((0, 0))
+        if entry['indef'] is not None:
+            mask |= HAS_INDEF
+            indef.append(add(entry['indef']))
+        else:
+            indef.append((0, 0))
+        flags.append(mask)
+        pps.extend((pp.start, pp.end) for pp in entry['pps'])
+        pp_index.append(len(pps))
+    heading_offsets = [add(h) for h in headings]
+    n = len(src)
+    strings_at = text[-1]
+    def pairs(values, dtype, shift=0):
+        return numpy.array(values, dtype=dtype).reshape(len(values), 2) + \
+                dtype(shift)
+    return {
+        'text': numpy.array(text, dtype=numpy.uint64),
+        'src': numpy.array(src, dtype=numpy.int32),
+        'span': pairs(span, numpy.int32),
+        'flags': numpy.array(flags, dtype=numpy.uint8),
+        'nsubj': pairs(nsubj, numpy.int32),
+        'tag': numpy.array(tag, dtype=numpy.uint8),
+        'orth': pairs(orth, numpy.uint64, strings_at),
+        'indef': pairs(indef, numpy.uint64, strings_at),
+        'pp_index': numpy.array(pp_index, dtype=numpy.uint32),
+        'pps': pairs(pps, numpy.int32),
+        'pp_entry': numpy.repeat(numpy.arange(n, dtype=numpy.int32),
+            numpy.diff(pp_index)),
+        'headings': pairs(heading_offsets, numpy.uint64, strings_at),
+        'blob': numpy.array(bytearray(''.join(texts + strings)),
+            dtype=numpy.uint8),
+    }
+
+def write_columns(path, header, columns):
+    """write a store with the given header (to which the column layout is
+    added) and columns (a dict of name -> array, without the buckets, which
+    are worked out here)"""
+    buckets = entry_bucket_indexes(columns['flags'])
+    columns = dict(columns, **dict(('bucket_' + name, buckets[name])
+        for name in entry_buckets))
+    columns = [(name, column.astype(column.dtype.newbyteorder('<')))
+            for name, column in sorted(columns.iteritems())]
+    header = dict(header, columns=dict())
+    offset = 0
+    for name, column in columns:
+        header['columns'][name] = [offset, column.dtype.str, column.shape]
+        offset += -(-column.nbytes // 8) * 8
+    header = json.dumps(header)
+    header += ' ' * (-(8 + len(header)) % 8)
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as fh:
+        fh.write(MAGIC)
+        fh.write(struct.pack('<I', len(header)))
+        fh.write(header)
+        for name, column in columns:
+            data = column.tostring()
+            fh.write(data)
+            fh.write('\0' * (-len(data) % 8))
+    os.rename(tmp, path)
+
+def write(path, key, sdb, line_hashes=(), digest=None):
+    """write the entries in sdb (a SentenceDB or SentenceStore) to a store at
+    path, along with its chapter headings. line_hashes are the hashes of the
+    corpus lines the entries came from, and digest identifies the corpus
+    file itself (see gen.load_or_build_sentence_db). returns the number of
+    entries."""
+    tags = list()
+    columns = entry_columns(sdb, sdb.buckets['headings'], tags)
+    columns['line_hashes'] = numpy.unique(
+            numpy.array(line_hashes, dtype=numpy.uint64))
+    write_columns(path, {'key': key, 'tags': tags, 'digest': digest},
+            columns)
+    return len(columns['src'])
+
+def append(store, path, entries, headings, line_hashes, digest=None):
+    """write a store to path with everything in store, followed by entries
+    (with their headings, and the hashes of the lines they came from). the
+    entries already in store are copied over column by column, not read or
+    made again. returns the number of entries added."""
+    tags = list(store.tags)
+    known = set(store.buckets['headings'])
+    headings = [h for h in headings if not(h in known or known.add(h))]
+    new = entry_columns(entries, headings, tags)
+    old_texts = store.text[-1]
+    new_texts = new['text'][-1]
+    old_blob = numpy.uint64(len(store.blob))
+    n = len(store.src)
+    # the texts in the merged blob are the old ones followed by the new ones;
+    # after them come the old strings, then the new strings
+    def strings(name):
+        return numpy.concatenate([getattr(store, name) + new_texts,
+            new[name] + old_blob])
+    columns = {
+        'text': numpy.concatenate([store.text, new['text'][1:] + old_texts]),
+        'orth': strings('orth'),
+        'indef': strings('indef'),
+        'headings': strings('headings'),
+        'pp_index': numpy.concatenate([store.pp_index,
+            new['pp_index'][1:] + numpy.uint32(len(store.pps))]),
+        'pp_entry': numpy.concatenate([store.pp_entry,
+            new['pp_entry'] + numpy.int32(n)]),
+        'blob': numpy.concatenate([store.blob[:int(old_texts)],
+            new['blob'][:int(new_texts)], store.blob[int(old_texts):],
+            new['blob'][int(new_texts):]]),
+        'line_hashes': numpy.union1d(store.line_hashes,
+            numpy.array(line_hashes, dtype=numpy.uint64)),
+    }
+    for name in ('src', 'span', 'flags', 'nsubj', 'tag', 'pps'):
+        columns[name] = numpy.concatenate([getattr(store, name), new[name]])
+    write_columns(path, {'key': store.key, 'tags': tags, 'digest': digest},
+            columns)
+    return len(new['src'])
+
+def load(path, key):
+    """the SentenceStore at path, or None if there isn't one (or the file
+    there is something else, like a database saved by an older version of
+    gen.py), or if it was written with a different key."""
+    try:
+        fh = open(path, 'rb')
+    except IOError:
+        return None
+    with fh:
+        if fh.read(4) != MAGIC:
+            return None
+        size = struct.unpack('<I', fh.read(4))[0]
+        header = json.loads(fh.read(size))
+        if header['key'] != key:
+            return None
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    return SentenceStore(mm, header, 8 + size)
+
+class Bucket(object):
+    """a bucket of a SentenceStore: a sequence (so that random.choice works
+    on it) of whatever get returns for each of indexes."""
+    __slots__ = ('indexes', 'get')
+    def __init__(self, indexes, get):
+        self.indexes = indexes
+        self.get = get
+    def __len__(self):
+        return len(self.indexes)
+    def __getitem__(self, i):
+        return self.get(int(self.indexes[i]))
+    def __iter__(self):
+        for i in xrange(len(self.indexes)):
+            yield self[i]
+
+class SentenceStore(object):
+    """a sentence database written by write(). works the same as a
+    SentenceDB (and picks the same entries given the same random numbers),
+    but makes each entry when it's asked for."""
+    def __init__(self, mm, header, data_at):
+        self.mm = mm
+        self.key = header['key']
+        self.tags = header['tags']
+        self.digest = header['digest']
+        for name, (offset, dtype, shape) in header['columns'].iteritems():
+            dtype = numpy.dtype(str(dtype))
+            count = int(numpy.prod(shape))
+            if count == 0:
+                column = numpy.zeros(shape, dtype=dtype)
+            else:
+                column = numpy.frombuffer(mm, dtype=dtype, count=count,
+                        offset=data_at + offset).reshape(shape)
+            setattr(self, name, column)
+        self.blob_at = data_at + header['columns']['blob'][0]
+        self.count = len(self.src)
+        self.buckets = dict((name,
+            Bucket(getattr(self, 'bucket_' + name), self.entry))
+            for name in entry_buckets)
+        self.buckets['pps'] = Bucket(xrange(len(self.pps)), self.pp)
+        self.buckets['nps'] = Bucket(self.bucket_with_subj, self.nsubj_span)
+        self.buckets['headings'] = Bucket(xrange(len(self.headings)),
+                self.heading)
+
+    # (numpy scalars are slow to work with, so values are taken out of the
+    # columns with item() and tolist())
+    def string(self, start, end):
+        return self.mm[self.blob_at+start:self.blob_at+end].decode('utf8')
+
+    def entry_text(self, i):
+        return self.string(*self.text[i:i+2].tolist())
+
+    def nsubj_span(self, i, text=None):
+        "the subject of entry i, as a gen.SpanRecord"
+        if text is None:
+            text = self.entry_text(i)
+        start, end = self.nsubj[i].tolist()
+        return gen.SpanRecord(text, start, end,
+                gen.TokenRecord(self.string(*self.orth[i].tolist()),
+                    self.tags[self.tag.item(i)]))
+
+    def pp(self, j):
+        "prepositional phrase j, as a gen.SpanRecord"
+        start, end = self.pps[j].tolist()
+        text = self.entry_text(self.pp_entry.item(j))
+        return gen.SpanRecord(text, start, end)
+
+    def heading(self, j):
+        return self.string(*self.headings[j].tolist())
+
+    def entry(self, i):
+        "entry i, as a dict like the ones in a SentenceDB"
+        text = self.entry_text(i)
+        flags = self.flags.item(i)
+        nsubj = None
+        plural = None
+        if flags & HAS_SUBJ:
+            nsubj = self.nsubj_span(i, text)
+            plural = bool(flags & PLURAL)
+        indef = None
+        if flags & HAS_INDEF:
+            indef = self.string(*self.indef[i].tolist())
+        start, end = self.span[i].tolist()
+        pp_start, pp_end = self.pp_index[i:i+2].tolist()
+        return {
+            'src': self.src.item(i),
+            'text': text,
+            'span': gen.SpanRecord(text, start, end),
+            'nsubj': nsubj,
+            'agree': bool(flags & AGREE),
+            'plural': plural,
+            'pps': [gen.SpanRecord(text, *pp)
+                for pp in self.pps[pp_start:pp_end].tolist()],
+            'indef': indef,
+        }
+
+    def choice(self, bucket, rng=random):
+        if gen.stats is not None:
+            gen.stats.bucket_picks[bucket] += 1
+        return rng.choice(self.buckets[bucket])
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for i in xrange(self.count):
+            yield self.entry(i)
@@ -122,6 +122,33 @@ class TestExtraction(unittest.TestCase):
         self.assertEqual(get_nsubj(ccs[0]).text, "The sea")
         self.assertEqual(get_nsubj(ccs[1]).text, "a slight breeze")
 
+    def test_same_as_array_versions(self):
+        import extract
+        def nsubj(fn, s):
+            try:
+                return fn(s).text
+            except ValueError:
+                return None
+        for text in [u"The sea was pretty calm; a slight breeze blew on land.",
+                u"The storm continued four days, and the snow had reached a depth very uncommon; but day after day the search was renewed.",
+                u"The river, which was swollen with rain, ran past the mill and into the valley below.",
+                u"Along the ridge the pines stood black against the sky.",
+                u"Rain."]:
+            s = first_s(nlp, text)
+            arrays = extract.DocArrays(s.doc)
+            self.assertEqual(nsubj(extract.get_nsubj, s),
+                    nsubj(lambda s: extract.array_get_nsubj(s, arrays), s))
+            ccs = extract.clauses(s)
+            self.assertEqual([c.text for c in ccs],
+                    [c.text for c in extract.array_clauses(s, arrays)])
+            for c in [s] + ccs:
+                self.assertEqual(nsubj(extract.get_nsubj, c),
+                        nsubj(extract.array_get_nsubj, c))
+                self.assertEqual(
+                        [pp.text for pp in extract.prep_phrases(c.root)],
+                        [pp.text for pp in
+                            extract.array_prep_phrases(c.root, arrays)])
+
     def test_requires_past_tense_agreement(self):
         from extract import requires_past_tense_agreement
         s = first_s(nlp,
@@ -155,6 +182,626 @@ class TestExtraction(unittest.TestCase):
         s = first_s(nlp, u"all the windows were broken")
         self.assertEqual(u"some windows", indefify(get_nsubj(s)))
 
+    def test_has_mid_sentence_caps(self):
+        from extract import has_mid_sentence_caps
+        self.assertFalse(has_mid_sentence_caps(u"The river ran."))
+        self.assertTrue(has_mid_sentence_caps(u"The river ran to Utah."))
+        self.assertTrue(has_mid_sentence_caps(u"the river ran (Utah)."))
+        self.assertTrue(has_mid_sentence_caps(u"The river ran to \xc9ze."))
+        self.assertTrue(has_mid_sentence_caps(u"The \u03a9 river ran."))
+        self.assertFalse(has_mid_sentence_caps(u"The river ran to \xe9ze."))
+        self.assertFalse(has_mid_sentence_caps(u"The river ran 3D."))
+
+    def test_nature_sentences(self):
+        from extract import nature_sentences, FilterStats
+        stats = FilterStats()
+        text = u"The river flowed gently past the old stone mill. " \
+                u"\"Look,\" he said. The tree is tall."
+        self.assertEqual(list(nature_sentences(nlp, text, stats)),
+                [u"The river flowed gently past the old stone mill."])
+        self.assertEqual(stats.candidates, 3)
+        self.assertEqual(stats.kept, 1)
+        self.assertEqual(stats.rejected['text: length'], 2)
+
+    def test_filter_parsed(self):
+        import os, shutil, tempfile
+        from extract import nature_sentences, parse_rough_sentences, \
+                filter_parsed, FilterStats
+        from extract_nature_sentences import read_parse_cache, \
+                write_parse_cache
+        text = [u"The river flowed gently past the old stone mill. "
+                u"\"Look,\" he said. The tree is tall.",
+                u"The snow had drifted deep against the rocks. "
+                u"We packed the horses while the guide went ahead."]
+        stats = FilterStats()
+        expected = list(nature_sentences(nlp, text, stats))
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'book.docs')
+            self.assertEqual(read_parse_cache(nlp, path), None)
+            for docs in [write_parse_cache(path,
+                    parse_rough_sentences(nlp, text)),
+                    read_parse_cache(nlp, path)]:
+                cached_stats = FilterStats()
+                self.assertEqual(
+                        list(filter_parsed(nlp, docs, cached_stats)),
+                        expected)
+                self.assertEqual(cached_stats.rejected, stats.rejected)
+                self.assertEqual(cached_stats.kept, stats.kept)
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_query(self):
+        from extract import parse_rough_sentences, sentence_is_past, \
+                subjects_are_natural, has_pronoun_subject
+        from query import ParsedSentences, compile_query, \
+                matching_sentences, QueryStats
+        text = [u"The river flowed gently past the old stone mill. "
+                u"The tree is tall. It rained. The wind and the rain "
+                u"swept over the hills.",
+                u"The snow had drifted deep against the rocks. "
+                u"We packed the horses while the guide went ahead."]
+        docs = list(parse_rough_sentences(nlp, text))
+        sents = [s for doc in docs for s in doc.sents]
+        clauses = compile_query("root tag VBD, all subject lemmas in "
+                "category natural, no PRP subject, length 10-140")
+        stats = QueryStats(clauses)
+        self.assertEqual(
+                matching_sentences(clauses, ParsedSentences(docs), stats),
+                [s.text for s in sents if sentence_is_past(s) and
+                    subjects_are_natural(s) and
+                    not(has_pronoun_subject(nlp, s)) and
+                    10 < len(s.text) < 140])
+        self.assertEqual(stats.given["root tag VBD"], len(sents))
+        self.assertRaises(ValueError, compile_query, "some nsubj")
+        # has_pronoun_subject only looks at the root's subject; the query
+        # looks at every subject in the sentence
+        s = first_s(nlp, u"The river rose after it rained.")
+        self.assertFalse(has_pronoun_subject(nlp, s))
+        clauses = compile_query("no PRP subject")
+        self.assertEqual(matching_sentences(clauses,
+            ParsedSentences([s.doc]), QueryStats(clauses)), [])
+
+    def test_parse_lines(self):
+        from gen import parse_lines, entry_from_row
+        from extract import get_nsubj, prep_phrases
+        text = u"The growing darkness seemed a protection from the wind."
+        row, clause_rows = list(parse_lines(nlp, [u"1\t" + text]))[0]
+        entry = entry_from_row(row)
+        s = first_s(nlp, text)
+        self.assertEqual(entry['span'].text, s.text)
+        self.assertEqual(entry['nsubj'].text, get_nsubj(s).text)
+        self.assertEqual(entry['nsubj'].root.orth_, get_nsubj(s).root.orth_)
+        self.assertEqual([pp.text for pp in entry['pps']],
+                [pp.text for pp in prep_phrases(s.root)])
+        self.assertEqual(entry['indef'], u"a growing darkness")
+
+    def test_seeded_novel(self):
+        from gen import parse_entries, SentenceDB, seeded_novel
+        lines = [u"1\tThe river ran over the rocks near the mill.",
+                u"1\tThe trees were tall in the valley.",
+                u"2\tThe wind blew across the plain; the grass bent."]
+        sdb = SentenceDB(parse_entries(nlp, lines))
+        one = list(seeded_novel(sdb, 12, 'test', workers=1))
+        self.assertEqual(len(one), 12)
+        self.assertEqual(one, list(seeded_novel(sdb, 12, 'test', workers=3)))
+        self.assertNotEqual(one, list(seeded_novel(sdb, 12, 'other')))
+
+    def test_write_novels(self):
+        import json, os, shutil, tempfile
+        from gen import parse_entries, SentenceDB, write_novels
+        lines = [u"1\tThe river ran over the rocks near the mill.",
+                u"2\tThe wind blew across the plain; the grass bent."]
+        tmp = tempfile.mkdtemp()
+        try:
+            manifest = write_novels(SentenceDB(parse_entries(nlp, lines)),
+                    "x\n<<chapters>>\ny\n", 3, 4, tmp, seed='test')
+            self.assertEqual([n['file'] for n in manifest['novels']],
+                    ['novel-0000.tex', 'novel-0001.tex', 'novel-0002.tex'])
+            self.assertEqual(len(set(n['seed'] for n in manifest['novels'])),
+                    3)
+            with open(os.path.join(tmp, 'manifest.json')) as fh:
+                self.assertEqual(json.load(fh)['words'], manifest['words'])
+            for n in manifest['novels']:
+                self.assertTrue(n['words'] > 0)
+                with open(os.path.join(tmp, n['file'])) as fh:
+                    self.assertEqual(fh.read().count("\\chapter{"), 4)
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_generation_stats(self):
+        import gen
+        from gen import parse_entries, SentenceDB, seeded_novel
+        lines = [u"1\tThe river ran over the rocks near the mill.",
+                u"2\tThe wind blew across the plain; the grass bent."]
+        sdb = SentenceDB(parse_entries(nlp, lines))
+        plain = list(seeded_novel(sdb, 6, 'test'))
+        stats = gen.enable_stats()
+        try:
+            self.assertEqual(list(seeded_novel(sdb, 6, 'test', workers=2)),
+                    plain)
+        finally:
+            gen.stats = None
+        report = stats.report()
+        self.assertEqual(sum(report['chapter_lengths'].values()), 6)
+        self.assertEqual(
+                sum(r['calls'] for r in report['realizers'].values()),
+                sum(n * count for n, count
+                    in report['paragraph_lengths'].iteritems()))
+        self.assertEqual(report['phases']['surface']['calls'], 6)
+        self.assertEqual(report['bucket_picks']['headings'], 6)
+
+    def test_sentence_store(self):
+        import os, shutil, tempfile
+        from gen import parse_entries, SentenceDB, \
+                seeded_novel, save_sentence_db, load_sentence_db
+        lines = [u"1\tThe river ran over the rocks near the mill.",
+                u"1\tThe trees were tall in the valley.",
+                u"2\tRained all day in the hills.",
+                u"2\tThe wind blew across the plain; the grass bent."]
+        sdb = SentenceDB(parse_entries(nlp, lines))
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'test.sdb')
+            save_sentence_db(sdb, path, 'key')
+            self.assertEqual(load_sentence_db(path, 'other key'), None)
+            store = load_sentence_db(path, 'key')
+            self.assertEqual(len(store), len(sdb))
+            for entry, stored in zip(sdb, store):
+                self.assertEqual(stored['text'], entry['text'])
+                self.assertEqual(stored['span'].text, entry['span'].text)
+                self.assertEqual([pp.text for pp in stored['pps']],
+                        [pp.text for pp in entry['pps']])
+                for key in ('src', 'agree', 'plural', 'indef'):
+                    self.assertEqual(stored[key], entry[key])
+                if entry['nsubj'] is None:
+                    self.assertEqual(stored['nsubj'], None)
+                else:
+                    self.assertEqual(stored['nsubj'].text,
+                            entry['nsubj'].text)
+                    self.assertEqual(stored['nsubj'].root.tag_,
+                            entry['nsubj'].root.tag_)
+            self.assertEqual(list(store.buckets['headings']),
+                    sdb.buckets['headings'])
+            # same picks from the same random numbers
+            self.assertEqual(list(seeded_novel(store, 12, 'test')),
+                    list(seeded_novel(sdb, 12, 'test')))
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_append_sentence_db(self):
+        import os, shutil, tempfile
+        from gen import parse_entries, SentenceDB, line_hash, \
+                save_sentence_db, load_sentence_db, append_sentence_db
+        old = [u"1\tThe river ran over the rocks near the mill.",
+                u"2\tThe wind blew across the plain; the grass bent."]
+        new = [u"2\tThe wind blew across the plain; the grass bent.",
+                u"3\tThe trees were tall in the valley.",
+                u"3\tThe trees were tall in the valley."]
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'test.sdb')
+            save_sentence_db(SentenceDB(parse_entries(nlp, old)), path, 'key',
+                    [line_hash(line) for line in old])
+            store = load_sentence_db(path, 'key')
+            self.assertEqual(append_sentence_db(store, path, nlp, old + new),
+                    1)
+            appended = load_sentence_db(path, 'key')
+            self.assertEqual([e['text'] for e in appended],
+                    [e['text'] for e in store] +
+                    [u"The trees were tall in the valley."])
+            self.assertEqual(len(appended.line_hashes), 3)
+            self.assertEqual(
+                    [e['text'] for e in appended.buckets['with_subj']],
+                    [e['text'] for e in store.buckets['with_subj']] +
+                    [u"The trees were tall in the valley."])
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_paragraph_model(self):
+        import numpy
+        from gen import ParagraphModel, paragraph_model, motion, affection
+        model = ParagraphModel({'start': {'motion': 3, 'affection': 1},
+            'end-chapter': ['motion'], 'end-novel': ['affection'],
+            'motion': ['end_para'], 'affection': ['affection', 'end_para']})
+        rs = numpy.random.RandomState(0)
+        sequences = model.sample(['start'] * 4000, rs)
+        firsts = [seq[0] for seq in sequences]
+        self.assertAlmostEqual(firsts.count(motion) / 4000.0, 0.75, 1)
+        self.assertEqual(model.sample(['end-chapter'], rs), [[motion]])
+        for seq in model.sample(['end-novel'] * 10, rs):
+            self.assertEqual(set(seq), set([affection]))
+        self.assertRaises(ValueError, ParagraphModel, {'start': ['asdf']})
+        ParagraphModel(paragraph_model)
+
+class TestNormalize(unittest.TestCase):
+    def sentences(self):
+        """the sample sentences from benchmark.py, the sentence corpus (if
+        it's here) and some random strings made of the characters that
+        normalize cares about"""
+        import os, random
+        from benchmark import sample_sentences, read_sentences
+        sentences = list(sample_sentences)
+        corpus = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                'nature_sentences.txt')
+        if os.path.exists(corpus):
+            sentences.extend(read_sentences(corpus))
+        rng = random.Random(0)
+        pieces = list(u"ais '\"`_-(){}.,;:!?\r\n\t&%$#~^\\<>") + \
+            [u"others", u" i ", u"'s", u"--", u" - ", u"( ", u" )"]
+        for i in range(20000):
+            sentences.append(u"x" + u"".join(rng.choice(pieces)
+                for j in range(rng.randrange(20))))
+        return sentences
+
+    def test_same_as_reference(self):
+        from benchmark import reference_normalize, reference_punctuate, \
+            reference_depunct, reference_tex_escape
+        from extract import normalize, punctuate, depunct
+        from gen import tex_escape
+        for s in self.sentences():
+            normalized = normalize(s)
+            self.assertEqual(normalized, reference_normalize(s))
+            self.assertEqual(punctuate(normalized),
+                    reference_punctuate(normalized))
+            self.assertEqual(depunct(s), reference_depunct(s))
+            self.assertEqual(tex_escape(s), reference_tex_escape(s))
+        self.assertEqual(tex_escape("50% & #1"), r"50\% \& \#1")
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp)
+
+    def read(self, path):
+        with open(path, 'rb') as fh:
+            return fh.read()
+
+    def extract(self, path, books, resume=False):
+        "writes books (book id -> sentences) as main would, skipping done ones"
+        from extract_nature_sentences import Checkpoint
+        checkpoint = Checkpoint(path, resume, stamp='v2')
+        for book_id in sorted(books):
+            if str(book_id) not in checkpoint.done:
+                checkpoint.write_book(book_id, books[book_id])
+        checkpoint.close()
+        return checkpoint
+
+    def test_recover(self):
+        import os
+        from extract_nature_sentences import Checkpoint
+        path = os.path.join(self.tmp, 'out.txt')
+        with open(path, 'wb') as fh:
+            fh.write("1\tThe river ran.\n1\tThe wind blew.\n"
+                    "2\tThe lake froze.\n"  # not in the manifest
+                    "3\tThe snow fell.\n"  # extracted with an old stamp
+                    "4\tThe sea ro")  # torn
+        with open(path + ".manifest", 'wb') as fh:
+            fh.write("1\t2\tv2\n3\t1\tv1\n4\t1")
+        checkpoint = Checkpoint(path, True, stamp='v2')
+        checkpoint.close()
+        self.assertEqual(checkpoint.done, {'1': 2})
+        self.assertEqual(self.read(path),
+                "1\tThe river ran.\n1\tThe wind blew.\n")
+        self.assertEqual(self.read(path + ".manifest"), "1\t2\tv2\n")
+
+    def test_resume(self):
+        import os
+        books = {1: [u"The river ran.", u"The wind blew."], 2: [],
+                3: [u"The snow fell."], 4: [u"The sea rose."]}
+        whole = os.path.join(self.tmp, 'whole.txt')
+        self.extract(whole, books)
+        resumed = os.path.join(self.tmp, 'resumed.txt')
+        self.extract(resumed, dict((b, books[b]) for b in (1, 2)))
+        with open(resumed, 'ab') as fh:
+            fh.write("3\tThe snow fe")  # crashed partway through book 3
+        checkpoint = self.extract(resumed, books, resume=True)
+        self.assertEqual(sorted(checkpoint.done), ['1', '2', '3', '4'])
+        self.assertEqual(self.read(resumed), self.read(whole))
+        # recover() rewrites the manifest in no particular order
+        self.assertEqual(
+                sorted(self.read(resumed + ".manifest").splitlines()),
+                sorted(self.read(whole + ".manifest").splitlines()))
+
+    def test_resume_needs_output(self):
+        import os, subprocess, sys
+        proc = subprocess.Popen([sys.executable,
+            'extract_nature_sentences.py', '--resume'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = proc.communicate()
+        self.assertEqual(proc.returncode, 2)
+        self.assertTrue("--resume needs --output" in err)
+
+class TestGenServer(unittest.TestCase):
+    def setUp(self):
+        import threading
+        import genserver
+        class StubGenerator(genserver.Generator):
+            "a Generator that doesn't load anything"
+            def __init__(self):
+                self.lock = threading.Lock()
+                self.reloading = threading.Lock()
+                self.template = None
+            def reload(self):
+                return 0
+            def chapters(self, count, seed):
+                raise RuntimeError("secret details")
+        self.generator = StubGenerator()
+        # the server logs every request (and 500s' tracebacks) to stderr
+        import sys, StringIO
+        self.stderr = sys.stderr
+        sys.stderr = StringIO.StringIO()
+        self.server = genserver.make_server(self.generator, 0)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        import sys
+        self.server.shutdown()
+        self.server.server_close()
+        sys.stderr = self.stderr
+
+    def request(self, method, path):
+        "(status, body) for a request to the server"
+        import httplib
+        conn = httplib.HTTPConnection(*self.server.server_address)
+        try:
+            conn.request(method, path)
+            response = conn.getresponse()
+            return response.status, response.read()
+        finally:
+            conn.close()
+
+    def test_params(self):
+        from genserver import seed_param, int_param, BadRequest
+        self.assertEqual(seed_param({'seed': 'abc-1.2_x'}), 'abc-1.2_x')
+        for seed in ['', 'a' * 65, 'a\r\nSet-Cookie: x=1', 'a b']:
+            self.assertRaises(BadRequest, seed_param, {'seed': seed})
+        self.assertTrue(len(seed_param({})) > 0)
+        self.assertEqual(int_param({}, 'count', 3), 3)
+        self.assertEqual(int_param({'count': '10'}, 'count', 3), 10)
+        for value in ['x', '0', '10001']:
+            self.assertRaises(BadRequest, int_param, {'count': value},
+                    'count', 3)
+        self.assertEqual(self.request('GET', '/chapters?seed=a%0d%0aX:1')[0],
+                400)
+        self.assertEqual(self.request('GET', '/chapters?count=x')[0], 400)
+
+    def test_metrics(self):
+        from genserver import Metrics
+        metrics = Metrics(window=100)
+        for i in range(1, 201):
+            metrics.record('/chapters', i / 1000.0, error=(i % 50 == 0))
+        report = metrics.report()['/chapters']
+        self.assertEqual(report['count'], 200)
+        self.assertEqual(report['errors'], 4)
+        # only the last 100 latencies (101ms to 200ms) are kept
+        self.assertAlmostEqual(report['mean_ms'], 150.5)
+        self.assertAlmostEqual(report['p50_ms'], 151)
+        self.assertAlmostEqual(report['p95_ms'], 196)
+        self.assertAlmostEqual(report['max_ms'], 200)
+
+    def test_routing(self):
+        self.assertEqual(self.request('GET', '/nothing')[0], 404)
+        self.assertEqual(self.request('POST', '/chapters')[0], 404)
+        self.assertEqual(self.request('GET', '/reload')[0], 404)
+        with self.generator.reloading:
+            self.assertEqual(self.request('POST', '/reload')[0], 409)
+        status, body = self.request('GET', '/chapters?seed=1')
+        self.assertEqual(status, 500)
+        self.assertFalse('secret' in body or 'Traceback' in body)
+        self.assertEqual(self.request('GET', '/paragraph?state=end_para')[0],
+                400)
+        self.assertEqual(self.request('POST', '/reload')[0], 202)
+        with self.generator.reloading:
+            pass # wait for it to finish
+
+class TestGutenfetch(unittest.TestCase):
+    def setUp(self):
+        import os
+        self.metadata = os.path.join(
+                os.path.dirname(os.path.abspath(__file__)), 'fixtures',
+                'metadata.json')
+
+    def records(self):
+        import json
+        with open(self.metadata) as fh:
+            return [json.loads(line) for line in fh]
+
+    def test_metadata_index(self):
+        import os, re, shutil, tempfile
+        from gutenfetch import MetadataIndex, tokens
+        records = self.records()
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'metadata.idx')
+            MetadataIndex.build(self.metadata).save(path)
+            index = MetadataIndex.load(path, self.metadata)
+            for pattern in ['Western|Science fiction|Geology|Natural|'
+                    'Exploration|Discovery|Physical', 'fiction$', '^Nile',
+                    'nothing like this']:
+                # the linear scan that the index replaced
+                self.assertEqual(index.subject_ids(pattern),
+                        [r['gutenberg_id'] for r in records
+                            if any(re.search(pattern, s['identifier'], re.I)
+                                for s in r['subjects'])])
+            for words in ['the', 'of the sea', 'GEOLOGY', 'lincoln\'s',
+                    'looking glass', 'the wild west']:
+                self.assertEqual(index.title_ids(words),
+                        [r['gutenberg_id'] for r in records
+                            if set(tokens(words)) <=
+                                set(tokens(r['title'] or u''))])
+            self.assertEqual(index.subject_token_ids('fiction'),
+                    [500, 9000, 31, 45])
+            for r in records:
+                self.assertEqual(index.record(r['gutenberg_id']), r)
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_strip_boilerplate(self):
+        from gutenfetch import strip_boilerplate
+        text = ["header\n", "*** START OF THIS PROJECT GUTENBERG EBOOK X ***\n",
+                "first\n", "last\n",
+                "*** END OF THIS PROJECT GUTENBERG EBOOK X ***\n",
+                "license\n"]
+        self.assertEqual(list(strip_boilerplate(text)),
+                ["first\n", "last\n"])
+        # older books
+        text = ["small print\n", "*END*THE SMALL PRINT! FOR PUBLIC DOMAIN "
+                "ETEXTS*Ver.04.29.93*END*\n", "first\n", "last\n",
+                "End of Project Gutenberg's X\n", "license\n"]
+        self.assertEqual(list(strip_boilerplate(text)),
+                ["first\n", "last\n"])
+        # no markers: nothing is dropped, however long the "header" is
+        text = ["line %d\n" % i for i in range(10)]
+        self.assertEqual(list(strip_boilerplate(text)), text)
+        self.assertEqual(list(strip_boilerplate(text, header_lines=3)), text)
+        # a start marker after header_lines lines doesn't count
+        text = ["a\n", "b\n", "*** START OF THE PROJECT GUTENBERG EBOOK\n",
+                "c\n"]
+        self.assertEqual(list(strip_boilerplate(text, header_lines=2)), text)
+        self.assertEqual(list(strip_boilerplate(text, header_lines=3)),
+                ["c\n"])
+
+    def test_paragraphs(self):
+        from gutenfetch import paragraphs
+        lines = ["\n", "The river\n", "ran.\n", "\n", "\n", "It was cold.",
+                "\n", "  The end.  "]
+        self.assertEqual(list(paragraphs(lines)),
+                ["The river ran.", "It was cold.", "The end."])
+        # a long paragraph is broken after the line that takes it past
+        # max_chars, and nothing is lost
+        lines = ["aaaa\n", "bbbb\n", "cccc\n", "dddd\n", "eeee\n", "\n",
+                "ffff\n"]
+        self.assertEqual(list(paragraphs(lines, max_chars=10)),
+                ["aaaa bbbb cccc", "dddd eeee", "ffff"])
+        self.assertEqual(list(paragraphs(lines, max_chars=9)),
+                ["aaaa bbbb", "cccc dddd", "eeee", "ffff"])
+
+class TestSeeds(unittest.TestCase):
+    def test_chapter_dates_stable(self):
+        import os, subprocess, sys
+        from gen import chapter_dates
+        code = "import gen\nprint gen.chapter_dates('42', 3)\n"
+        outputs = set(subprocess.check_output([sys.executable, flag, '-c',
+            code], cwd=os.path.dirname(os.path.abspath(__file__)))
+            for flag in ('-R', '-R', '-R', '-B'))
+        self.assertEqual(outputs, set([str(chapter_dates('42', 3)) + "\n"]))
+
+class TestRender(unittest.TestCase):
+    chapters = [
+        (u"Chapter 1: Rain", [[u"It rained.", u"Costs rose 5%."],
+            [u"The caf\xe9 closed & the cat left."]]),
+        (u"Chapter 2: Sun", [[u"The sun shone on the #1 hill."]]),
+    ]
+
+    def render(self, template):
+        import StringIO
+        from gen import render_latex_template
+        out = StringIO.StringIO()
+        render_latex_template(StringIO.StringIO(template.encode('utf8')),
+                iter(self.chapters), out)
+        return out.getvalue()
+
+    def in_memory(self, template):
+        "the rendering from before chapters were streamed"
+        from gen import to_latex
+        return template.replace(u"<<chapters>>",
+                u'\n'.join([to_latex(ch) for ch in self.chapters])
+                ).encode('utf8')
+
+    def test_streamed_matches_in_memory(self):
+        for template in (
+                u"\\begin{document}\n<<chapters>>\n\\end{document}\n",
+                u"\\title{Na\xefve}\n<<chapters>>",
+                u"<<chapters>>\n\\end{document}\n",
+                u"<<chapters>>",
+                u"\\begin{document}\nno chapters here\n"):
+            self.assertEqual(self.render(template), self.in_memory(template))
+
+    def test_no_chapters(self):
+        import StringIO
+        from gen import render_latex_template
+        out = StringIO.StringIO()
+        render_latex_template(StringIO.StringIO("head\n<<chapters>>tail\n"),
+                iter([]), out)
+        self.assertEqual(out.getvalue(), "head\ntail\n")
+
+class TestHeadingNouns(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp)
+
+    def write_cache(self, header, nouns):
+        import os
+        path = os.path.join(self.tmp, "nouns.headings")
+        with open(path, 'wb') as fh:
+            fh.write(u"\n".join([header] + nouns).encode('utf8'))
+        return path
+
+    def test_read_heading_nouns(self):
+        from gen import read_heading_nouns, heading_nouns_key
+        key = heading_nouns_key()
+        nouns = [u"the brook", u"the fen"]
+        self.assertEqual(read_heading_nouns(
+            self.write_cache(u"pattern-2.6:" + key, nouns), key),
+            (u"pattern-2.6", nouns))
+        for header in (key, u":" + key, u"pattern-:" + key,
+                u"pattern-2.6:something else"):
+            self.assertEqual(read_heading_nouns(
+                self.write_cache(header, nouns), key), None)
+        self.assertEqual(read_heading_nouns(
+            self.write_cache(u"pattern-2.6:" + key, []), key), None)
+        self.assertEqual(read_heading_nouns(
+            self.write_cache(u"pattern-2.6:" + key, nouns) + ".missing",
+            key), None)
+
+    def test_cached_without_pkg_resources(self):
+        import os, subprocess, sys
+        from gen import heading_nouns_key
+        path = self.write_cache(u"pattern-2.6:" + heading_nouns_key(),
+                [u"the brook", u"the fen"])
+        code = "import sys, gen\n" \
+            "gen.use_heading_nouns_cache(%r)\n" \
+            "print gen.chapter_heading_nouns()\n" \
+            "print gen.store_key('k')\n" \
+            "print 'pkg_resources' in sys.modules\n" % path
+        out = subprocess.check_output([sys.executable, '-c', code],
+                cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(out.split("\n")[:3], [
+            "[u'the brook', u'the fen']",
+            "k:pattern-2.6:" + heading_nouns_key(),
+            "False"])
+
+class TestStartup(unittest.TestCase):
+    # seconds that importing gen (and with it, extract) may take
+    import_budget = 1.0
+
+    def test_import_time(self):
+        import os, subprocess, sys
+        code = "import sys, time\n" \
+            "start = time.time()\n" \
+            "import gen\n" \
+            "print time.time() - start\n" \
+            "print ' '.join(m for m in ('pattern.en', 'spacy') " \
+            "if m in sys.modules)\n"
+        out = subprocess.check_output([sys.executable, '-c', code],
+                cwd=os.path.dirname(os.path.abspath(__file__)))
+        seconds, loaded = out.split("\n")[:2]
+        self.assertEqual(loaded, "")
+        self.assertTrue(float(seconds) < self.import_budget,
+                "importing gen took %ss" % seconds)
+
 
 if __name__ == '__main__':
     import sys, os
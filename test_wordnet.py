@@ -52,6 +52,44 @@ class TestWordNet(unittest.TestCase):
         self.assertFalse(lemma_is_natural('asdf'))
         self.assertFalse(lemma_is_natural('might'))
 
+    def test_lemma_categories(self):
+        from extract import lemma_categories, lemma_cache, NATURAL, \
+            PERSON, PHYSICAL_OBJECT, GEOLOGICAL_FORMATION
+        lemma_cache.clear()
+        beach = lemma_categories('beach')
+        self.assertTrue(beach & NATURAL)
+        self.assertTrue(beach & GEOLOGICAL_FORMATION)
+        self.assertFalse(beach & PERSON)
+        self.assertTrue(lemma_categories('baker') & PERSON)
+        self.assertEqual(lemma_categories('asdf'), 0)
+        self.assertEqual(lemma_categories('beach'), beach)
+        info = lemma_cache.info()
+        self.assertEqual(info['misses'], 3)
+        self.assertEqual(info['hits'], 1)
+
+    def test_lexicon(self):
+        import os, shutil, tempfile
+        from extract import classify_lemma
+        from lexicon import build, Lexicon
+        tmp = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(tmp, 'index.noun'), 'w') as fh:
+                fh.write("  license text\n")
+                for lemma in ['baker', 'beach', 'body_of_water', 'rock',
+                        'truth', 'might']:
+                    fh.write(lemma + " n 1 0 1 0 00000000\n")
+            path = os.path.join(tmp, 'table.lex')
+            self.assertEqual(build(path, tmp), 6)
+            table = Lexicon(path)
+            for lemma in ['baker', 'beach', 'body of water', 'rock', 'truth',
+                    'might']:
+                self.assertEqual(table.get(lemma), classify_lemma(lemma))
+            self.assertEqual(table.get('Body_of_water'),
+                    classify_lemma('body of water'))
+            self.assertEqual(table.get('asdf'), 0)
+        finally:
+            shutil.rmtree(tmp)
+
 if __name__ == '__main__':
     unittest.main()
 